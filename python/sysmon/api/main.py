@@ -44,7 +44,8 @@ def get_metric_history(
             seconds = value * 86400
     end = datetime.now()
     start = end - timedelta(seconds=seconds)
-    df = query_api.query_range(DB_PATH, metric, start, end, limit=limit, host=host)
+    df = query_api.query_range(DB_PATH, metric, start, end, limit=limit, host=host,
+                               with_datetime=True)
     if df.empty:
         return {"data": []}
     return {"data": df.to_dict(orient="records")}
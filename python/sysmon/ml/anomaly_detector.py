@@ -4,7 +4,7 @@ Combines statistical, ML-based, and baseline-based detection.
 """
 
 import numpy as np
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
 import sqlite3
 import os
@@ -79,23 +79,21 @@ class AnomalyDetector:
         
         cutoff_time = int((datetime.now() - timedelta(hours=hours)).timestamp())
         
+        # Timestamps are not needed, but sample order is (detector warm-up)
         cursor.execute("""
-            SELECT timestamp, value
+            SELECT value
             FROM metrics
             WHERE metric_type = ? AND host = ? AND timestamp >= ?
             ORDER BY timestamp ASC
         """, (metric_type, host, cutoff_time))
         
-        rows = cursor.fetchall()
+        values = np.fromiter((row[0] for row in cursor), dtype=np.float64)
         conn.close()
         
-        if len(rows) < 50:  # Need minimum samples for ML
-            print(f"Insufficient data for {key}: {len(rows)} samples")
+        if len(values) < 50:  # Need minimum samples for ML
+            print(f"Insufficient data for {key}: {len(values)} samples")
             return False
         
-        timestamps = np.array([row[0] for row in rows])
-        values = np.array([row[1] for row in rows])
-        
         # Initialize statistical detector
         if self.use_statistical:
             self.statistical_detectors[key] = StatisticalDetector(
@@ -124,7 +122,7 @@ class AnomalyDetector:
             self.baseline_learner.learn_baseline(metric_type, host, hours)
         
         self.trained_metrics[key] = True
-        print(f"Trained models for {key} with {len(rows)} samples")
+        print(f"Trained models for {key} with {len(values)} samples")
         return True
     
     def detect(
@@ -180,6 +178,7 @@ class AnomalyDetector:
                     value=value,
                     expected_value=baseline.mean
                 )
+            self.baseline_learner.observe(metric_type, value, timestamp, host)
         
         return results
     
@@ -188,7 +187,7 @@ class AnomalyDetector:
         metric_type: str,
         values: List[Tuple[int, float]],
         host: str = "localhost"
-    ) -> Dict[str, List[AnomalyResult]]:
+    ) -> Dict[str, Sequence[AnomalyResult]]:
         """
         Run batch anomaly detection.
         
@@ -198,7 +197,8 @@ class AnomalyDetector:
             host: Hostname
             
         Returns:
-            Dictionary of detection results by method
+            Dictionary of detection results by method (sequences of
+            AnomalyResult; statistical results are an AnomalyResultArray)
         """
         key = f"{host}:{metric_type}"
         results = {}
@@ -238,6 +238,8 @@ class AnomalyDetector:
                         expected_value=baseline.mean
                     ))
                 results['baseline'] = baseline_results
+            for timestamp, value in values:
+                self.baseline_learner.observe(metric_type, value, timestamp, host)
         
         return results
     
@@ -6,10 +6,11 @@ Learns normal behavior patterns and calculates dynamic thresholds.
 import sqlite3
 import numpy as np
 from typing import Dict, Optional, Tuple, List
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+from dataclasses import dataclass, field, replace
 import json
 import os
+import random
+import time
 
 
 @dataclass
@@ -25,6 +26,13 @@ class Baseline:
     last_updated: int  # Unix timestamp
     percentile_95: float
     percentile_99: float
+    # Precomputed 3-sigma thresholds (the default used by is_anomalous)
+    _lower3: float = field(init=False, repr=False, compare=False)
+    _upper3: float = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self._lower3 = self.mean - 3.0 * self.stddev
+        self._upper3 = self.mean + 3.0 * self.stddev
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization"""
@@ -56,6 +64,122 @@ class Baseline:
         return (lower, upper)
 
 
+class OnlineStats:
+    """
+    Incrementally maintained statistics for one metric stream.
+    
+    Mean and variance follow Welford's update until `window` samples have
+    been seen, then switch to exponential weighting (alpha = 1/window) so
+    old data fades out. Percentiles are estimated from a fixed-size
+    reservoir with random replacement.
+    
+    snapshot_count and snapshot_time record the state at the last seed or
+    snapshot, so callers can tell whether anything was observed since.
+    Samples at or before last_timestamp are already counted and ignored.
+    hours is the history window the stream was seeded from (0 if unseeded).
+    """
+    
+    def __init__(self, window: int, reservoir_size: int = 1024):
+        """
+        Initialize empty online statistics.
+        
+        Args:
+            window: Effective number of samples remembered
+            reservoir_size: Number of samples kept for percentile estimates
+        """
+        self.window = window
+        self.reservoir_size = reservoir_size
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.min_value = float('inf')
+        self.max_value = float('-inf')
+        self.reservoir: List[float] = []
+        self.snapshot_count = 0
+        self.snapshot_time = 0.0
+        self.last_timestamp = 0
+        self.hours = 0
+    
+    @classmethod
+    def from_history(
+        cls,
+        count: int,
+        mean: float,
+        variance: float,
+        min_value: float,
+        max_value: float,
+        values: np.ndarray,
+        last_timestamp: int,
+        hours: int,
+        reservoir_size: int = 1024
+    ) -> 'OnlineStats':
+        """Seed online statistics from a historical scan"""
+        stats = cls(window=max(count, 10), reservoir_size=reservoir_size)
+        stats.count = count
+        stats.mean = mean
+        stats.variance = variance
+        stats.min_value = min_value
+        stats.max_value = max_value
+        
+        if len(values) > reservoir_size:
+            values = np.random.choice(values, reservoir_size, replace=False)
+        stats.reservoir = [float(v) for v in values]
+        stats.snapshot_count = count
+        stats.snapshot_time = time.time()
+        stats.last_timestamp = last_timestamp
+        stats.hours = hours
+        
+        return stats
+    
+    def update(self, value: float, timestamp: int) -> bool:
+        """
+        Fold one new sample into the statistics (O(1))
+        
+        Returns:
+            False if the sample is not newer than the last one folded in
+        """
+        if timestamp <= self.last_timestamp:
+            return False
+        self.last_timestamp = timestamp
+        
+        self.count += 1
+        alpha = 1.0 / min(self.count, self.window)
+        delta = value - self.mean
+        self.mean += alpha * delta
+        self.variance = (1.0 - alpha) * (self.variance + alpha * delta * delta)
+        
+        if value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(value)
+        else:
+            self.reservoir[random.randrange(self.reservoir_size)] = value
+        
+        return True
+    
+    def snapshot(self, metric_type: str, host: str) -> Baseline:
+        """Build a Baseline from the current state, and mark it as snapshotted"""
+        self.snapshot_count = self.count
+        self.snapshot_time = time.time()
+        percentile_95, percentile_99 = np.percentile(self.reservoir, [95, 99])
+        
+        return Baseline(
+            metric_type=metric_type,
+            host=host,
+            mean=float(self.mean),
+            stddev=float(np.sqrt(self.variance)),
+            min_value=float(self.min_value),
+            max_value=float(self.max_value),
+            sample_count=self.count,
+            last_updated=int(time.time()),
+            percentile_95=float(percentile_95),
+            percentile_99=float(percentile_99)
+        )
+
+
 class BaselineLearner:
     """
     Learns and maintains baselines for metrics.
@@ -74,6 +198,8 @@ class BaselineLearner:
         
         self.db_path = db_path
         self.baselines: Dict[str, Baseline] = {}
+        # Streaming statistics per host:metric_type, fed by observe()
+        self._online: Dict[str, OnlineStats] = {}
         self._init_database()
         self._load_baselines()
     
@@ -141,7 +267,13 @@ class BaselineLearner:
         hours: int = 24
     ) -> Optional[Baseline]:
         """
-        Learn baseline from historical data.
+        Learn baseline for a metric.
+        
+        Uses the streaming statistics maintained by observe() when they were
+        seeded from the same `hours` window and samples arrived since the
+        last snapshot, taken less than `hours` ago. Otherwise scans
+        historical data: on cold start, for a different window, and for
+        metrics whose samples are not fed through observe().
         
         Args:
             metric_type: Type of metric (e.g., 'cpu.total_usage')
@@ -151,48 +283,95 @@ class BaselineLearner:
         Returns:
             Learned Baseline object or None if insufficient data
         """
+        key = f"{host}:{metric_type}"
+        online = self._online.get(key)
+        
+        if (online is not None and online.count >= 10
+                and online.hours == hours
+                and online.count > online.snapshot_count
+                and time.time() - online.snapshot_time <= hours * 3600):
+            baseline = online.snapshot(metric_type, host)
+        else:
+            baseline = self._learn_from_history(metric_type, host, hours)
+            if baseline is None:
+                return None
+        
+        # Same statistics as the stored baseline: keep its last_updated
+        previous = self.baselines.get(key)
+        if previous is not None and replace(baseline, last_updated=previous.last_updated) == previous:
+            return previous
+        
+        # Store baseline
+        self._save_baseline(baseline)
+        
+        # Cache in memory
+        self.baselines[key] = baseline
+        
+        return baseline
+    
+    def _learn_from_history(
+        self,
+        metric_type: str,
+        host: str,
+        hours: int
+    ) -> Optional[Baseline]:
+        """Learn baseline by scanning historical data, seeding online stats"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Get historical data
-        cutoff_time = int((datetime.now() - timedelta(hours=hours)).timestamp())
+        cutoff_time = int(time.time() - hours * 3600)
+        params = (metric_type, host, cutoff_time)
         
+        # Let SQLite compute the simple aggregates instead of shipping
+        # every sample into Python
         cursor.execute("""
-            SELECT timestamp, value
+            SELECT COUNT(*), AVG(value), SUM(value * value), MIN(value), MAX(value),
+                   MAX(timestamp)
             FROM metrics
             WHERE metric_type = ? AND host = ? AND timestamp >= ?
-            ORDER BY timestamp ASC
-        """, (metric_type, host, cutoff_time))
+        """, params)
         
-        rows = cursor.fetchall()
-        conn.close()
+        count, mean, sum_sq, min_value, max_value, last_timestamp = cursor.fetchone()
         
-        if len(rows) < 10:  # Need minimum samples
+        if count < 10:  # Need minimum samples
+            conn.close()
             return None
         
-        # Extract values
-        values = np.array([row[1] for row in rows])
+        # Population variance as E[x^2] - E[x]^2 (clamped against rounding)
+        variance = max(sum_sq / count - mean * mean, 0.0)
+        
+        # Percentiles still need the raw values (order-independent, so no
+        # timestamp column and no ORDER BY)
+        cursor.execute("""
+            SELECT value
+            FROM metrics
+            WHERE metric_type = ? AND host = ? AND timestamp >= ?
+        """, params)
+        
+        values = np.fromiter((row[0] for row in cursor), dtype=np.float64, count=count)
+        conn.close()
+        
+        percentile_95, percentile_99 = np.percentile(values, [95, 99])
         
         # Calculate statistics
         baseline = Baseline(
             metric_type=metric_type,
             host=host,
-            mean=float(np.mean(values)),
-            stddev=float(np.std(values)),
-            min_value=float(np.min(values)),
-            max_value=float(np.max(values)),
-            sample_count=len(values),
-            last_updated=int(datetime.now().timestamp()),
-            percentile_95=float(np.percentile(values, 95)),
-            percentile_99=float(np.percentile(values, 99))
+            mean=float(mean),
+            stddev=float(np.sqrt(variance)),
+            min_value=float(min_value),
+            max_value=float(max_value),
+            sample_count=count,
+            last_updated=int(time.time()),
+            percentile_95=float(percentile_95),
+            percentile_99=float(percentile_99)
         )
         
-        # Store baseline
-        self._save_baseline(baseline)
-        
-        # Cache in memory
-        key = f"{host}:{metric_type}"
-        self.baselines[key] = baseline
+        # Seed streaming statistics so later refreshes skip the scan
+        self._online[f"{host}:{metric_type}"] = OnlineStats.from_history(
+            count, float(mean), variance, float(min_value), float(max_value), values,
+            last_timestamp, hours
+        )
         
         return baseline
     
@@ -222,6 +401,32 @@ class BaselineLearner:
         conn.commit()
         conn.close()
     
+    def observe(
+        self,
+        metric_type: str,
+        value: float,
+        timestamp: int,
+        host: str = "localhost"
+    ) -> None:
+        """
+        Feed a newly ingested sample into the streaming statistics.
+        
+        Streams are seeded by each historical scan in learn_baseline();
+        samples observed before that are picked up by the scan itself.
+        Samples are deduplicated by timestamp: one at or before the newest
+        already counted (by the scan or an earlier call) is ignored, so
+        re-checking a stored sample does not count it again.
+        
+        Args:
+            metric_type: Type of metric
+            value: Sample value
+            timestamp: Sample Unix timestamp
+            host: Hostname
+        """
+        online = self._online.get(f"{host}:{metric_type}")
+        if online is not None:
+            online.update(value, timestamp)
+    
     def get_baseline(
         self, 
         metric_type: str, 
@@ -247,7 +452,7 @@ class BaselineLearner:
             return self.learn_baseline(metric_type, host)
         
         # Check if baseline is stale
-        age_seconds = datetime.now().timestamp() - baseline.last_updated
+        age_seconds = time.time() - baseline.last_updated
         if age_seconds > max_age_hours * 3600:
             # Relearn baseline
             return self.learn_baseline(metric_type, host)
@@ -309,8 +514,11 @@ class BaselineLearner:
         if baseline is None:
             return (False, None)
         
-        lower, upper = baseline.get_threshold(sigma)
-        is_anomalous = value < lower or value > upper
+        if sigma == 3.0:
+            is_anomalous = value < baseline._lower3 or value > baseline._upper3
+        else:
+            lower, upper = baseline.get_threshold(sigma)
+            is_anomalous = value < lower or value > upper
         
         return (is_anomalous, baseline)
     
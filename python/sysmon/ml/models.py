@@ -4,6 +4,7 @@ Implements both statistical and ML-based approaches.
 """
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from typing import List, Tuple, Optional, Dict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
@@ -11,6 +12,7 @@ from datetime import datetime, timedelta
 try:
     from sklearn.ensemble import IsolationForest
     from sklearn.preprocessing import StandardScaler
+    import joblib  # installed with scikit-learn
     SKLEARN_AVAILABLE = True
 except ImportError:
     SKLEARN_AVAILABLE = False
@@ -23,16 +25,88 @@ except ImportError:
     SCIPY_AVAILABLE = False
 
 
-@dataclass
+@dataclass(init=False)
 class AnomalyResult:
     """Result of anomaly detection"""
+    # Built once per sample, so no per-instance __dict__. Declared by hand:
+    # dataclass(slots=True) needs Python 3.10, and slots cannot coexist with
+    # class-level field defaults, hence the explicit __init__
+    __slots__ = ('is_anomaly', 'score', 'threshold', 'timestamp', 'value',
+                 'expected_value', 'confidence')
+
     is_anomaly: bool
     score: float  # Anomaly score (higher = more anomalous)
     threshold: float
     timestamp: int
     value: float
-    expected_value: Optional[float] = None
-    confidence: Optional[float] = None
+    expected_value: Optional[float]
+    confidence: Optional[float]
+
+    def __init__(self, is_anomaly: bool, score: float, threshold: float,
+                 timestamp: int, value: float,
+                 expected_value: Optional[float] = None,
+                 confidence: Optional[float] = None):
+        self.is_anomaly = is_anomaly
+        self.score = score
+        self.threshold = threshold
+        self.timestamp = timestamp
+        self.value = value
+        self.expected_value = expected_value
+        self.confidence = confidence
+
+
+@dataclass
+class AnomalyResultArray:
+    """
+    Columnar batch of anomaly results, one array element per sample.
+    Missing expected_value/confidence entries are stored as NaN.
+    
+    Behaves like a read-only sequence of AnomalyResult; indexing builds
+    the object on demand.
+    """
+    is_anomaly: np.ndarray
+    score: np.ndarray
+    timestamp: np.ndarray
+    value: np.ndarray
+    expected_value: np.ndarray
+    confidence: np.ndarray
+    threshold: float
+    
+    @classmethod
+    def empty(cls, n: int, threshold: float) -> 'AnomalyResultArray':
+        """Preallocate a batch of n non-anomalous results"""
+        return cls(
+            is_anomaly=np.zeros(n, dtype=bool),
+            score=np.zeros(n, dtype=np.float64),
+            timestamp=np.zeros(n, dtype=np.int64),
+            value=np.zeros(n, dtype=np.float64),
+            expected_value=np.full(n, np.nan),
+            confidence=np.full(n, np.nan),
+            threshold=threshold
+        )
+    
+    def __len__(self) -> int:
+        return len(self.value)
+    
+    def __getitem__(self, i: int) -> AnomalyResult:
+        expected = self.expected_value[i]
+        confidence = self.confidence[i]
+        return AnomalyResult(
+            is_anomaly=bool(self.is_anomaly[i]),
+            score=float(self.score[i]),
+            threshold=self.threshold,
+            timestamp=int(self.timestamp[i]),
+            value=float(self.value[i]),
+            expected_value=None if np.isnan(expected) else float(expected),
+            confidence=None if np.isnan(confidence) else float(confidence)
+        )
+    
+    def iter(self):
+        """Iterate as AnomalyResult objects"""
+        for i in range(len(self)):
+            yield self[i]
+    
+    __iter__ = iter
 
 
 class StatisticalDetector:
@@ -104,22 +178,81 @@ class StatisticalDetector:
             confidence=1.0 - (1.0 / (1.0 + z_score))  # Simple confidence metric
         )
     
-    def detect_batch(self, values: List[Tuple[int, float]]) -> List[AnomalyResult]:
+    def detect_batch(self, values: List[Tuple[int, float]]) -> AnomalyResultArray:
         """
         Detect anomalies in a batch of values.
         
+        Vectorized equivalent of calling detect() for each value in order:
+        each sample is scored against the moving window ending at itself.
+        
         Args:
             values: List of (timestamp, value) tuples
             
         Returns:
-            List of AnomalyResult objects
+            AnomalyResultArray with one entry per input value
         """
-        results = []
-        for timestamp, value in values:
-            result = self.detect(value, timestamp)
-            results.append(result)
+        n = len(values)
+        results = AnomalyResultArray.empty(n, self.z_threshold)
+        if n == 0:
+            return results
+        
+        results.timestamp[:] = np.fromiter((ts for ts, _ in values), dtype=np.int64, count=n)
+        vals = np.fromiter((val for _, val in values), dtype=np.float64, count=n)
+        results.value[:] = vals
+        
+        # Moving statistics over history + batch
+        h = len(self.history)
+        combined = np.concatenate([np.asarray(self.history, dtype=np.float64), vals])
+        means, stds = self._window_stats(combined, h)
+        
+        has_mean = ~np.isnan(means)
+        results.expected_value[has_mean] = means[has_mean]
+        
+        valid = has_mean & (stds >= 1e-6)
+        z_scores = np.abs(vals[valid] - means[valid]) / stds[valid]
+        results.score[valid] = z_scores
+        results.is_anomaly[valid] = z_scores > self.z_threshold
+        results.confidence[valid] = 1.0 - (1.0 / (1.0 + z_scores))
+        
+        # Carry state forward exactly as update() would have
+        self.history = combined[-self.window_size:].tolist()
+        if has_mean[-1]:
+            self.mean = float(means[-1])
+            self.std = float(stds[-1])
+        
         return results
     
+    def _window_stats(self, combined: np.ndarray, start: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean/std of the moving window ending at each position of combined[start:].
+        Positions with fewer than 10 points in their window are NaN.
+        """
+        n = len(combined) - start
+        w = self.window_size
+        means = np.full(n, np.nan)
+        stds = np.full(n, np.nan)
+        
+        # Windows still filling up (shorter than window_size)
+        n_partial = min(max(w - start - 1, 0), n)
+        for i in range(n_partial):
+            window = combined[:start + i + 1]
+            if len(window) >= 10:
+                means[i] = window.mean()
+                stds[i] = window.std()
+        
+        if n_partial == n or w < 10:
+            return means, stds
+        
+        # Full windows; chunked to bound the temporary n x window_size buffer
+        windows = sliding_window_view(combined, w)[start + n_partial + 1 - w:]
+        chunk = max(1, (1 << 20) // w)
+        for lo in range(0, len(windows), chunk):
+            block = windows[lo:lo + chunk]
+            means[n_partial + lo:n_partial + lo + len(block)] = block.mean(axis=1)
+            stds[n_partial + lo:n_partial + lo + len(block)] = block.std(axis=1)
+        
+        return means, stds
+    
     def seasonal_decompose(self, values: np.ndarray, period: int = 24) -> Dict[str, np.ndarray]:
         """
         Simple seasonal decomposition using moving averages.
@@ -285,6 +418,45 @@ class IsolationForestDetector:
         
         return results
     
+    def save(self, path: str) -> None:
+        """
+        Save the trained model to disk.
+        
+        Written uncompressed with joblib so load() can memory-map the
+        forest's arrays instead of unpickling copies of them.
+        
+        Args:
+            path: Destination file path
+        """
+        if not self.is_trained:
+            raise RuntimeError("Model must be trained before saving")
+        
+        joblib.dump({
+            'contamination': self.contamination,
+            'n_estimators': self.n_estimators,
+            'model': self.model,
+            'scaler': self.scaler,
+        }, path, compress=0)
+    
+    @classmethod
+    def load(cls, path: str) -> 'IsolationForestDetector':
+        """
+        Load a model saved with save().
+        
+        Args:
+            path: File written by save()
+            
+        Returns:
+            Trained IsolationForestDetector backed by read-only mapped arrays
+        """
+        state = joblib.load(path, mmap_mode='r')
+        
+        detector = cls(contamination=state['contamination'], n_estimators=state['n_estimators'])
+        detector.model = state['model']
+        detector.scaler = state['scaler']
+        detector.is_trained = True
+        return detector
+    
     @staticmethod
     def _create_features(values: np.ndarray, window_size: int = 5) -> np.ndarray:
         """
@@ -1,12 +1,20 @@
 """Storage module initialization"""
 
-from .database import MetricsDatabase, Metric, Metric1m, Metric1h, SchemaVersion
+from .database import (
+    MetricsDatabase,
+    Metric,
+    Metric1m,
+    Metric1h,
+    SchemaVersion
+)
 from .query_api import (
     query_range,
+    numpy_range,
     query_latest,
     aggregate_metrics,
     get_metric_types,
-    get_hosts
+    get_hosts,
+    get_catalog
 )
 
 __all__ = [
@@ -16,8 +24,10 @@ __all__ = [
     'Metric1h',
     'SchemaVersion',
     'query_range',
+    'numpy_range',
     'query_latest',
     'aggregate_metrics',
     'get_metric_types',
-    'get_hosts'
+    'get_hosts',
+    'get_catalog'
 ]
@@ -1,13 +1,37 @@
 """SQLAlchemy ORM models for metrics storage"""
 
-from sqlalchemy import Column, Integer, String, Float, Text, Index
+from sqlalchemy import Column, Integer, String, Float, Text, Index, case, func, literal_column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 import json
+import re
 
 Base = declarative_base()
 
+_TAG_KEY_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+
+def tag_value(tags_column, key: str):
+    """
+    SQL expression extracting one tag from a JSON tags column
+
+    Rows without JSON tags ('' for untagged metrics) yield NULL rather
+    than a "malformed JSON" error. The JSON path is rendered inline so
+    the expression can match an index on it.
+
+    Args:
+        tags_column: Tags column of a metrics table
+        key: Tag name (letters, digits and underscores only)
+    """
+    if not _TAG_KEY_RE.match(key):
+        raise ValueError(f"Invalid tag key: {key!r}")
+
+    return func.json_extract(
+        case((func.json_valid(tags_column), tags_column)),
+        literal_column(f"'$.{key}'")
+    )
+
 
 class Metric(Base):
     """Main metrics table - time-series data with 1-second resolution"""
@@ -19,10 +43,12 @@ class Metric(Base):
     tags = Column(Text, primary_key=True, nullable=False, default='')
     value = Column(Float, nullable=False)
 
+    # Mirrors sysmond's schema (schema version 2), which owns this table
     __table_args__ = (
-        Index('idx_metric_time', 'metric_type', 'timestamp'),
         Index('idx_host_time', 'host', 'timestamp'),
         Index('idx_timestamp', 'timestamp'),
+        # Covering index: per-metric range reads (metric_type, time range) -> host, value
+        Index('idx_metric_type_ts', 'metric_type', 'timestamp', 'host', 'value'),
         {'sqlite_autoincrement': False}
     )
 
@@ -80,6 +106,36 @@ class SchemaVersion(Base):
     applied_at = Column(Integer, nullable=False)
 
 
+# Applied to every new connection (journal_mode is persistent, but only a
+# writer can switch it, so readers skip it)
+_CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',  # 256 MB
+    'PRAGMA cache_size=-65536',    # 64 MB
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def configure_connections(engine, read_only: bool = False):
+    """
+    Tune every connection the engine opens
+
+    Args:
+        engine: SQLAlchemy engine bound to the metrics database
+        read_only: Set query_only instead of switching the journal to WAL
+    """
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute('PRAGMA journal_mode=WAL')
+        for pragma in _CONNECTION_PRAGMAS:
+            cursor.execute(pragma)
+        if read_only:
+            cursor.execute('PRAGMA query_only=1')
+        cursor.close()
+
+
 class MetricsDatabase:
     """Database connection manager"""
 
@@ -91,6 +147,7 @@ class MetricsDatabase:
             db_path: Path to SQLite database file
         """
         self.engine = create_engine(f'sqlite:///{db_path}', echo=False)
+        configure_connections(self.engine)
         self.Session = sessionmaker(bind=self.engine)
 
     def get_session(self):
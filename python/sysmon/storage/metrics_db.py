@@ -0,0 +1,392 @@
+"""Lightweight sqlite3 metrics store (no SQLAlchemy dependency)"""
+
+import sqlite3
+import json
+import numbers
+import time
+import os
+import threading
+from typing import List, Dict, Optional, Any
+from contextlib import contextmanager
+
+
+# Rows per multi-VALUES INSERT: 5 columns x 180 rows = 900 parameters,
+# under SQLITE_MAX_VARIABLE_NUMBER (999) of older SQLite builds
+_BATCH_ROWS = 180
+
+# Per-connection settings; journal_mode=WAL is persistent and set once with the schema
+_CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-20000',
+)
+
+# Prepared statements kept per connection (sqlite3's LRU is keyed by SQL text)
+_STATEMENT_CACHE_SIZE = 256
+
+_INSERT_PREFIX = 'INSERT INTO metrics (timestamp, metric_type, host, value, tags) VALUES '
+_INSERT_SQL = _INSERT_PREFIX + '(?, ?, ?, ?, ?)'
+
+
+# Secondary indexes on metrics. The first two cover per-metric reads
+# (optionally per host): range/latest queries and aggregates are answered
+# from the index alone, and ORDER BY timestamp [DESC] walks it without a sort
+_INDEXES = (
+    ('ix_metrics_type_ts', 'CREATE INDEX IF NOT EXISTS ix_metrics_type_ts ON metrics(metric_type, timestamp, host, value, tags)'),
+    ('ix_metrics_type_host_ts', 'CREATE INDEX IF NOT EXISTS ix_metrics_type_host_ts ON metrics(metric_type, host, timestamp, value, tags)'),
+    ('idx_metrics_time', 'CREATE INDEX IF NOT EXISTS idx_metrics_time ON metrics(timestamp)'),
+    ('ix_metrics_host', 'CREATE INDEX IF NOT EXISTS ix_metrics_host ON metrics(host)'),
+)
+_INDEX_NAMES = tuple(name for name, _ in _INDEXES)
+
+# Distinct hosts and metric types, kept current by trigger so listing them
+# reads a handful of rows instead of scanning metrics (this store owns its
+# metrics table; sysmond databases are read through query_api instead)
+_DIMENSIONS = (('metric_types', 'metric_type'), ('metric_hosts', 'host'))
+
+_DIMENSION_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS trg_metrics_dimensions
+    AFTER INSERT ON metrics
+    BEGIN
+        INSERT OR IGNORE INTO metric_types (name) VALUES (NEW.metric_type);
+        INSERT OR IGNORE INTO metric_hosts (name) VALUES (NEW.host);
+    END
+'''
+
+
+def _timestamp(value) -> int:
+    """Integer seconds for the timestamp column (also numpy integers)"""
+    # Whole seconds keep timestamp comparisons integer-only in the indexes
+    if not isinstance(value, numbers.Integral):
+        raise TypeError(f"timestamp must be integer seconds, got {type(value).__name__}")
+    return int(value)
+
+
+def _encode_tags(tags: Optional[Dict[str, str]]) -> str:
+    # Untagged samples (the common case) skip the encoder entirely
+    return json.dumps(tags, separators=(',', ':')) if tags else ''
+
+
+def _rows_to_dicts(rows, metric_type: str) -> List[Dict[str, Any]]:
+    """
+    Result dicts for (timestamp, host, value, tags) rows of one metric
+
+    The metric_type column is not read back: every row shares the
+    caller's string instead of decoding its own copy.
+    """
+    return [
+        {
+            'timestamp': timestamp,
+            'metric_type': metric_type,
+            'host': host,
+            'value': value,
+            'tags': json.loads(tags) if tags else {}
+        }
+        for timestamp, host, value, tags in rows
+    ]
+
+
+class MetricsDatabase:
+    """SQLite storage for raw metrics"""
+
+    def __init__(self, db_path: str):
+        """
+        Initialize metrics database
+
+        Args:
+            db_path: Path to SQLite database, or a "file:" URI such as
+                "file:name?mode=memory&cache=shared"
+        """
+        self._uri = db_path.startswith('file:')
+        if self._uri:
+            self.db_path = db_path
+        else:
+            self.db_path = os.path.expanduser(db_path)
+
+            # Create directory if needed
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        # One long-lived connection for the instance, so its prepared
+        # statements and PRAGMAs are kept; holding it open also keeps a
+        # shared in-memory database alive. Threads share it one
+        # transaction at a time under _lock.
+        self._conn = sqlite3.connect(self.db_path, timeout=10.0, uri=self._uri,
+                                     check_same_thread=False,
+                                     cached_statements=_STATEMENT_CACHE_SIZE)
+        self._conn.row_factory = sqlite3.Row
+        for pragma in _CONNECTION_PRAGMAS:
+            self._conn.execute(pragma)
+        self._lock = threading.Lock()
+
+        # Initialize schema
+        self._init_schema()
+
+    @contextmanager
+    def _get_connection(self):
+        """Context manager for a transaction on the shared connection"""
+        with self._lock:
+            try:
+                yield self._conn
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _init_schema(self):
+        """Initialize database schema"""
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Readers proceed alongside the writer; commits append to the WAL
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+            # Rowid table: repeated (timestamp, metric_type, host) samples are kept
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS metrics (
+                    id INTEGER PRIMARY KEY,
+                    timestamp INTEGER NOT NULL,
+                    metric_type TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    tags TEXT DEFAULT ''
+                )
+            ''')
+
+            for _, ddl in _INDEXES:
+                cursor.execute(ddl)
+
+            existing = {row[0] for row in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for table, _ in _DIMENSIONS:
+                cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} (name TEXT PRIMARY KEY)')
+            cursor.execute(_DIMENSION_TRIGGER)
+
+            # Backfill dimension tables added after data was already written
+            for table, column in _DIMENSIONS:
+                if table not in existing:
+                    cursor.execute(f'INSERT OR IGNORE INTO {table} (name) '
+                                   f'SELECT {column} FROM metrics GROUP BY {column}')
+
+    def insert_metric(self, timestamp: int, metric_type: str, host: str, value: float,
+                      tags: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Insert a single metric
+
+        Returns:
+            True if successful
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    _INSERT_SQL,
+                    (_timestamp(timestamp), metric_type, host, value, _encode_tags(tags))
+                )
+                return True
+        except Exception as e:
+            print(f"Error inserting metric {metric_type}: {e}")
+            return False
+
+    def insert_metrics_batch(self, metrics: List[Dict[str, Any]]) -> bool:
+        """
+        Insert a batch of metrics in one transaction
+
+        Rows go in as multi-VALUES INSERTs of up to _BATCH_ROWS rows, so
+        SQLite prepares and steps one statement per chunk instead of per row.
+
+        Args:
+            metrics: List of dicts with keys timestamp, metric_type, host, value, tags
+
+        Returns:
+            True if successful
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for start in range(0, len(metrics), _BATCH_ROWS):
+                    chunk = metrics[start:start + _BATCH_ROWS]
+                    # Extending one list in place measured faster than
+                    # itertools.chain or a nested comprehension; typed arrays
+                    # don't help, sqlite3 binds each value as a Python object
+                    params = []
+                    for m in chunk:
+                        params += (_timestamp(m['timestamp']), m['metric_type'], m['host'],
+                                   m['value'], _encode_tags(m.get('tags')))
+                    conn.execute(_INSERT_PREFIX + ','.join(['(?, ?, ?, ?, ?)'] * len(chunk)),
+                                 params)
+                return True
+        except Exception as e:
+            print(f"Error inserting metrics batch: {e}")
+            return False
+
+    @contextmanager
+    def bulk_load_context(self):
+        """
+        Context manager for loading many rows without index maintenance
+
+        Drops the secondary indexes on entry and rebuilds them on exit, so
+        inserts inside only append to the table. Reads inside the block fall
+        back to full scans; use it for offline loads, not on a live store.
+
+        Example:
+            with db.bulk_load_context():
+                db.insert_metrics_batch(metrics)
+        """
+        with self._get_connection() as conn:
+            for name in _INDEX_NAMES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+        try:
+            yield self
+        finally:
+            with self._get_connection() as conn:
+                for _, ddl in _INDEXES:
+                    conn.execute(ddl)
+
+    def get_metric_count(self, metric_type: Optional[str] = None) -> int:
+        """Count stored samples, optionally for one metric type"""
+        with self._get_connection() as conn:
+            if metric_type is None:
+                row = conn.execute('SELECT COUNT(*) FROM metrics').fetchone()
+            else:
+                row = conn.execute('SELECT COUNT(*) FROM metrics WHERE metric_type = ?',
+                                   (metric_type,)).fetchone()
+            return row[0]
+
+    def query_latest(self, metric_type: str, host: Optional[str] = None,
+                     limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Get the most recent samples of a metric, newest first
+
+        Args:
+            metric_type: Metric type to query
+            host: Optional host filter
+            limit: Maximum number of samples
+        """
+        with self._get_connection() as conn:
+            if host is None:
+                cursor = conn.execute('''
+                    SELECT timestamp, host, value, tags FROM metrics
+                    WHERE metric_type = ?
+                    ORDER BY timestamp DESC LIMIT ?
+                ''', (metric_type, limit))
+            else:
+                cursor = conn.execute('''
+                    SELECT timestamp, host, value, tags FROM metrics
+                    WHERE metric_type = ? AND host = ?
+                    ORDER BY timestamp DESC LIMIT ?
+                ''', (metric_type, host, limit))
+            return _rows_to_dicts(cursor, metric_type)
+
+    def query_time_range(self, metric_type: str, start: int, end: int,
+                         host: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get samples of a metric in [start, end], oldest first
+
+        Args:
+            metric_type: Metric type to query
+            start: Start timestamp (inclusive)
+            end: End timestamp (inclusive)
+            host: Optional host filter
+        """
+        with self._get_connection() as conn:
+            if host is None:
+                cursor = conn.execute('''
+                    SELECT timestamp, host, value, tags FROM metrics
+                    WHERE metric_type = ? AND timestamp BETWEEN ? AND ?
+                    ORDER BY timestamp
+                ''', (metric_type, start, end))
+            else:
+                cursor = conn.execute('''
+                    SELECT timestamp, host, value, tags FROM metrics
+                    WHERE metric_type = ? AND host = ? AND timestamp BETWEEN ? AND ?
+                    ORDER BY timestamp
+                ''', (metric_type, host, start, end))
+            return _rows_to_dicts(cursor, metric_type)
+
+    def get_hosts(self) -> List[str]:
+        """
+        Get all hosts that have reported metrics, sorted
+
+        Hosts stay listed after retention deletes their last sample.
+        """
+        with self._get_connection() as conn:
+            return [row[0] for row in conn.execute('SELECT name FROM metric_hosts ORDER BY name')]
+
+    def get_metric_types(self) -> List[str]:
+        """Get all metric types ever stored, sorted (not pruned by retention)"""
+        with self._get_connection() as conn:
+            return [row[0] for row in conn.execute('SELECT name FROM metric_types ORDER BY name')]
+
+    def delete_old_metrics(self, retention_days: int) -> int:
+        """
+        Delete samples older than the retention period
+
+        Returns:
+            Number of deleted samples
+        """
+        cutoff = int(time.time()) - retention_days * 86400
+        with self._get_connection() as conn:
+            return conn.execute('DELETE FROM metrics WHERE timestamp < ?', (cutoff,)).rowcount
+
+    def clear(self):
+        """Delete every sample, and the host and metric type lists"""
+        with self._get_connection() as conn:
+            conn.execute('DELETE FROM metrics')
+            for table, _ in _DIMENSIONS:
+                conn.execute(f'DELETE FROM {table}')
+
+    def get_database_size(self) -> int:
+        """Get database size in bytes (page_count * page_size, so also in-memory)"""
+        with self._get_connection() as conn:
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            return page_count * page_size
+
+    def close(self):
+        """Close the connection (this also releases an in-memory database)"""
+        with self._lock:
+            self._conn.close()
+
+    def _aggregate(self, columns: str, metric_type: str, start: int, end: int,
+                   host: Optional[str]) -> sqlite3.Row:
+        """Evaluate aggregate `columns` over value in [start, end] in SQLite"""
+        with self._get_connection() as conn:
+            if host is None:
+                return conn.execute(
+                    f'SELECT {columns} FROM metrics WHERE metric_type = ? AND timestamp BETWEEN ? AND ?',
+                    (metric_type, start, end)
+                ).fetchone()
+            return conn.execute(
+                f'SELECT {columns} FROM metrics '
+                f'WHERE metric_type = ? AND host = ? AND timestamp BETWEEN ? AND ?',
+                (metric_type, host, start, end)
+            ).fetchone()
+
+    def get_average(self, metric_type: str, start: int, end: int,
+                    host: Optional[str] = None) -> Optional[float]:
+        """Average value in [start, end], or None if there are no samples"""
+        return self._aggregate('AVG(value)', metric_type, start, end, host)[0]
+
+    def get_min(self, metric_type: str, start: int, end: int,
+                host: Optional[str] = None) -> Optional[float]:
+        """Minimum value in [start, end], or None if there are no samples"""
+        return self._aggregate('MIN(value)', metric_type, start, end, host)[0]
+
+    def get_max(self, metric_type: str, start: int, end: int,
+                host: Optional[str] = None) -> Optional[float]:
+        """Maximum value in [start, end], or None if there are no samples"""
+        return self._aggregate('MAX(value)', metric_type, start, end, host)[0]
+
+    def get_summary(self, metric_type: str, start: int, end: int,
+                    host: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Count, average, min and max of a metric in [start, end]
+
+        All four come from a single pass over the covering index; prefer this
+        to separate get_average/get_min/get_max calls when several are needed.
+        """
+        row = self._aggregate('COUNT(value), AVG(value), MIN(value), MAX(value)',
+                              metric_type, start, end, host)
+        return {'count': row[0], 'avg': row[1], 'min': row[2], 'max': row[3]}
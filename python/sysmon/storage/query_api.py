@@ -1,11 +1,291 @@
 """Query API for historical metrics data"""
 
 from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import quote
+import os
+import threading
 from typing import List, Dict, Optional, Union
+import numpy as np
 import pandas as pd
-from sqlalchemy import and_, func
+from sqlalchemy import Integer, and_, bindparam, create_engine, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from .database import (
+    Metric,
+    Metric1m,
+    Metric1h,
+    configure_connections,
+    tag_value
+)
+
+# Rows fetched per batch when streaming large result sets
+_YIELD_PER = 10000
+
+# Pooled read-only connections per database
+_READ_POOL_SIZE = 4
+
+_ENGINE_LOCK = threading.Lock()
+
+# Typed columns for frames built from results (others stay Python objects)
+_COLUMN_DTYPES = {'timestamp': np.int64, 'value': np.float64}
+
+# Low-cardinality string columns, stored as pandas categoricals
+_CATEGORY_COLUMNS = ('metric_type', 'host', 'tags')
+
+# Largest LIMIT for which result columns are allocated up front
+_MAX_PRESIZE = 1 << 20
+
+# Latest-value lookups walk idx_metric_type_ts backwards from the newest
+# entry; with a host, non-matching hosts are skipped inside the index. Kept
+# as two statements so the unfiltered one stays a single index probe.
+_LATEST = text("""
+    SELECT timestamp, metric_type, host, tags, value
+    FROM metrics
+    WHERE metric_type = :metric_type
+    ORDER BY timestamp DESC
+    LIMIT 1
+""")
+
+_LATEST_FOR_HOST = text("""
+    SELECT timestamp, metric_type, host, tags, value
+    FROM metrics
+    WHERE metric_type = :metric_type AND host = :host
+    ORDER BY timestamp DESC
+    LIMIT 1
+""")
+
+
+def _distinct_cte(name: str, column: str) -> str:
+    """
+    CTE listing the sorted distinct values of an indexed metrics column
+
+    A loose index scan: each step seeks the next larger key
+    (MIN(column) WHERE column > previous) in idx_metric_type_ts /
+    idx_host_time, so the cost is one index probe per distinct value
+    instead of a scan over every row.
+    """
+    return f"""
+        {name}(v) AS (
+            SELECT MIN({column}) FROM metrics
+            UNION ALL
+            SELECT (SELECT MIN({column}) FROM metrics WHERE {column} > v)
+            FROM {name} WHERE v IS NOT NULL
+        )"""
+
+
+# Metric types and hosts in one statement, as (column, value) rows
+_CATALOG = text(f"""
+    WITH RECURSIVE{_distinct_cte('metric_types', 'metric_type')},{_distinct_cte('hosts', 'host')}
+    SELECT 'metric_types', v FROM metric_types WHERE v IS NOT NULL
+    UNION ALL
+    SELECT 'hosts', v FROM hosts WHERE v IS NOT NULL
+""")
+
+_AGG_FUNCS = {
+    'avg': func.avg,
+    'min': func.min,
+    'max': func.max,
+    'sum': func.sum
+}
+
+
+def _get_engine(db_path: str) -> Engine:
+    """Shared read-only engine per database file"""
+    # Serialise first use, so concurrent callers share one engine
+    with _ENGINE_LOCK:
+        return _open_engine(db_path)
+
+
+@lru_cache(maxsize=None)
+def _open_engine(db_path: str) -> Engine:
+    """
+    Create the read-only engine for a database file
+
+    Connections open the file with mode=ro and are pooled across threads.
+    Nothing here writes: the schema and its indexes belong to sysmond,
+    which creates and migrates them (metrics_storage.cpp).
+    """
+    uri = f'file:{quote(os.path.abspath(db_path))}?mode=ro&uri=true'
+    engine = create_engine(
+        f'sqlite:///{uri}',
+        connect_args={'check_same_thread': False},
+        poolclass=QueuePool,
+        pool_size=_READ_POOL_SIZE
+    )
+    configure_connections(engine, read_only=True)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def _get_sessionmaker(db_path: str) -> sessionmaker:
+    """Session factory bound to the cached engine for db_path"""
+    return sessionmaker(bind=_get_engine(db_path))
+
+
+def _to_timestamp(value: Union[datetime, int, float]) -> int:
+    """Unix timestamp as int, so binds compare as INTEGER against the column"""
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def _resolution_table(start: int, end: int, resolution: str):
+    """
+    Pick the table for a resolution, auto-selecting it from the time range
+
+    Raw data is kept for 24 hours and 1-minute rollups for 30 days, so
+    "auto" reads the finest table that still covers the whole range.
+    """
+    if resolution == "auto":
+        time_range = end - start
+        if time_range <= 86400:  # <= 24 hours
+            resolution = "1s"
+        elif time_range <= 2592000:  # <= 30 days
+            resolution = "1m"
+        else:
+            resolution = "1h"
+
+    if resolution == "1m":
+        return Metric1m
+    elif resolution == "1h":
+        return Metric1h
+    return Metric
+
+
+def _frame_from_result(result, size: int = 0) -> pd.DataFrame:
+    """
+    Build a DataFrame column by column from a streamed Core result
 
-from .database import MetricsDatabase, Metric, Metric1m, Metric1h
+    Rows are consumed one yield_per partition at a time, so only a single
+    batch of row tuples is alive at once. Numeric columns go into typed
+    arrays, pre-sized when the row count is bounded (LIMIT); metric_type,
+    host and tags become categoricals. Repeated strings are collapsed to
+    one shared object while collecting, so each distinct value (e.g. a
+    tags blob) is held once rather than once per row. NULL tags come
+    back as ''.
+
+    Args:
+        result: Result executed with the yield_per execution option
+        size: Upper bound on the row count (0 = unknown)
+
+    Returns:
+        DataFrame with the result's columns, in order
+    """
+    names = list(result.keys())
+    if size > _MAX_PRESIZE:
+        # A huge LIMIT is no real bound; grow in batches instead
+        size = 0
+
+    arrays = {}
+    for name, dtype in _COLUMN_DTYPES.items():
+        if name in names:
+            arrays[name] = np.empty(size, dtype=dtype) if size else []
+    objects = {name: [] for name in names if name not in arrays}
+    interned = {name: {} for name in objects}
+    if 'tags' in interned:
+        # sysmond stores untagged samples with NULL tags; interning maps
+        # them to '' so they stay a category instead of becoming NaN
+        interned['tags'][None] = ''
+
+    count = 0
+    for rows in result.partitions():
+        n = len(rows)
+        for name, values in zip(names, zip(*rows)):
+            if name in objects:
+                seen = interned[name]
+                objects[name].extend([seen.setdefault(v, v) for v in values])
+            elif size:
+                arrays[name][count:count + n] = values
+            else:
+                arrays[name].append(np.array(values, dtype=_COLUMN_DTYPES[name]))
+        count += n
+
+    data = {}
+    for name in names:
+        if name in _CATEGORY_COLUMNS:
+            data[name] = pd.Categorical(objects[name])
+        elif name in objects:
+            data[name] = objects[name] or np.empty(0, dtype=object)
+        elif size:
+            data[name] = arrays[name][:count]
+        elif arrays[name]:
+            data[name] = np.concatenate(arrays[name])
+        else:
+            data[name] = np.empty(0, dtype=_COLUMN_DTYPES[name])
+
+    return pd.DataFrame(data, columns=names)
+
+
+@lru_cache(maxsize=128)
+def _range_statement(table_class, with_host: bool, tag_keys: tuple, with_limit: bool):
+    """
+    Select for query_range, built once per filter shape
+
+    Every value is a named bind parameter (metric_type, start, end, host,
+    tag_<key>, limit), so one statement serves all calls of that shape.
+    """
+    t = table_class.__table__
+    stmt = select(t.c.timestamp, t.c.metric_type, t.c.host, t.c.tags, t.c.value).where(
+        and_(
+            t.c.metric_type == bindparam('metric_type'),
+            t.c.timestamp >= bindparam('start', type_=Integer),
+            t.c.timestamp <= bindparam('end', type_=Integer)
+        )
+    )
+
+    if with_host:
+        stmt = stmt.where(t.c.host == bindparam('host'))
+
+    # Exact JSON match per key (raises ValueError on unsafe keys)
+    for key in tag_keys:
+        stmt = stmt.where(tag_value(t.c.tags, key) == bindparam(f'tag_{key}'))
+
+    # Order and limit. SQLite walks the (metric_type, [host,] timestamp)
+    # indexes backwards for this, so a LIMIT stops after `limit` index
+    # entries; no DESC index or ordered subquery is needed.
+    stmt = stmt.order_by(t.c.timestamp.desc())
+    if with_limit:
+        stmt = stmt.limit(bindparam('limit', type_=Integer))
+
+    return stmt
+
+
+@lru_cache(maxsize=None)
+def _aggregate_statement(table_class, agg_func: str):
+    """
+    Select for aggregate_metrics, built once per table and function
+
+    Binds metric_type, start, end, bucket (seconds) and bucket_start.
+    """
+    t = table_class.__table__
+    agg_col = _AGG_FUNCS[agg_func](t.c.value).label('value')
+
+    # Group by time windows. Offsets are taken from the aligned start of the
+    # first bucket, so the expression stays plain integer arithmetic on top
+    # of the (metric_type, timestamp) range scan instead of a float cast.
+    bucket = bindparam('bucket', type_=Integer)
+    bucket_start = bindparam('bucket_start', type_=Integer)
+    time_window = (t.c.timestamp - bucket_start) // bucket * bucket + bucket_start
+
+    return select(
+        time_window.label('timestamp'),
+        t.c.metric_type,
+        t.c.host,
+        agg_col
+    ).where(
+        and_(
+            t.c.metric_type == bindparam('metric_type'),
+            t.c.timestamp >= bindparam('start', type_=Integer),
+            t.c.timestamp <= bindparam('end', type_=Integer)
+        )
+    ).group_by(
+        time_window,
+        t.c.metric_type,
+        t.c.host
+    ).order_by(time_window.desc())
 
 
 def query_range(
@@ -16,7 +296,8 @@ def query_range(
     resolution: str = "auto",
     host: Optional[str] = None,
     tags: Optional[Dict[str, str]] = None,
-    limit: int = 0
+    limit: int = 0,
+    with_datetime: bool = False
 ) -> pd.DataFrame:
     """
     Query metrics within a time range
@@ -30,86 +311,83 @@ def query_range(
         host: Filter by hostname (None = all hosts)
         tags: Filter by tags (JSON matching)
         limit: Maximum number of results (0 = no limit)
+        with_datetime: Also add a pandas datetime column ("datetime")
 
     Returns:
         DataFrame with columns: timestamp, metric_type, host, tags, value
+        (and datetime when requested)
     """
-    # Convert datetimes to Unix timestamps
-    if isinstance(start, datetime):
-        start = int(start.timestamp())
-    if isinstance(end, datetime):
-        end = int(end.timestamp())
+    # Convert datetimes (and float timestamps) to integer Unix timestamps
+    start, end = _to_timestamp(start), _to_timestamp(end)
 
-    # Auto-select resolution based on time range
-    if resolution == "auto":
-        time_range = end - start
-        if time_range <= 86400:  # <= 24 hours
-            resolution = "1s"
-        elif time_range <= 2592000:  # <= 30 days
-            resolution = "1m"
-        else:
-            resolution = "1h"
+    table_class = _resolution_table(start, end, resolution)
+    tag_keys = tuple(sorted(tags)) if tags else ()
+    stmt = _range_statement(table_class, bool(host), tag_keys, limit > 0)
 
-    # Select appropriate table
-    if resolution == "1m":
-        table_class = Metric1m
-    elif resolution == "1h":
-        table_class = Metric1h
-    else:
-        table_class = Metric
+    params = {'metric_type': metric_type, 'start': start, 'end': end}
+    if host:
+        params['host'] = host
+    for key in tag_keys:
+        params[f'tag_{key}'] = tags[key]
+    if limit > 0:
+        params['limit'] = limit
+
+    Session = _get_sessionmaker(db_path)
+
+    with Session() as session:
+        result = session.execute(stmt, params, execution_options={'yield_per': _YIELD_PER})
+        df = _frame_from_result(result, size=limit)
+
+    if with_datetime:
+        df['datetime'] = pd.to_datetime(df['timestamp'].to_numpy(), unit='s', cache=True)
+
+    return df
+
+
+def numpy_range(
+    db_path: str,
+    metric_type: str,
+    start: Union[datetime, int],
+    end: Union[datetime, int],
+    host: Optional[str] = None
+) -> np.ndarray:
+    """
+    Query raw (timestamp, value) pairs straight into a NumPy array
+
+    Fast path for numeric consumers (e.g. ML training) that do not need
+    a DataFrame. Always reads the 1-second table.
 
-    # Build query
-    db = MetricsDatabase(db_path)
-    session = db.get_session()
-
-    try:
-        query = session.query(table_class).filter(
-            and_(
-                table_class.metric_type == metric_type,
-                table_class.timestamp >= start,
-                table_class.timestamp <= end
-            )
+    Args:
+        db_path: Path to SQLite database
+        metric_type: Type of metric
+        start: Start time (datetime or Unix timestamp)
+        end: End time (datetime or Unix timestamp)
+        host: Filter by hostname (None = all hosts)
+
+    Returns:
+        Structured array with fields 'timestamp' (int64) and 'value'
+        (float64), ordered by timestamp ascending
+    """
+    start, end = _to_timestamp(start), _to_timestamp(end)
+
+    t = Metric.__table__
+    stmt = select(t.c.timestamp, t.c.value).where(
+        and_(
+            t.c.metric_type == metric_type,
+            t.c.timestamp >= bindparam('start', start, type_=Integer),
+            t.c.timestamp <= bindparam('end', end, type_=Integer)
         )
+    )
+    if host:
+        stmt = stmt.where(t.c.host == host)
+    stmt = stmt.order_by(t.c.timestamp)
+
+    dtype = np.dtype([('timestamp', np.int64), ('value', np.float64)])
+    Session = _get_sessionmaker(db_path)
 
-        # Add optional filters
-        if host:
-            query = query.filter(table_class.host == host)
-
-        if tags:
-            # Note: This is a simple contains check, not exact JSON matching
-            for key, value in tags.items():
-                tag_pattern = f'%"{key}":"{value}"%'
-                query = query.filter(table_class.tags.like(tag_pattern))
-
-        # Order and limit
-        query = query.order_by(table_class.timestamp.desc())
-        if limit > 0:
-            query = query.limit(limit)
-
-        # Execute and convert to DataFrame
-        results = query.all()
-        
-        if not results:
-            return pd.DataFrame(columns=['timestamp', 'metric_type', 'host', 'tags', 'value'])
-
-        data = [{
-            'timestamp': r.timestamp,
-            'metric_type': r.metric_type,
-            'host': r.host,
-            'tags': r.tags,
-            'value': r.value
-        } for r in results]
-
-        df = pd.DataFrame(data)
-        
-        # Convert timestamp to datetime for convenience
-        df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-        
-        return df
-
-    finally:
-        session.close()
-        db.close()
+    with Session() as session:
+        result = session.execute(stmt, execution_options={'yield_per': _YIELD_PER})
+        return np.fromiter((tuple(r) for r in result), dtype=dtype)
 
 
 def query_latest(
@@ -128,31 +406,20 @@ def query_latest(
     Returns:
         Dictionary with latest metric data, or None if not found
     """
-    db = MetricsDatabase(db_path)
-    session = db.get_session()
-
-    try:
-        query = session.query(Metric).filter(Metric.metric_type == metric_type)
-        
-        if host:
-            query = query.filter(Metric.host == host)
-        
-        result = query.order_by(Metric.timestamp.desc()).first()
-        
-        if result:
-            return {
-                'timestamp': result.timestamp,
-                'metric_type': result.metric_type,
-                'host': result.host,
-                'tags': result.tags,
-                'value': result.value
-            }
-        
-        return None
-
-    finally:
-        session.close()
-        db.close()
+    if host:
+        stmt, params = _LATEST_FOR_HOST, {'metric_type': metric_type, 'host': host}
+    else:
+        stmt, params = _LATEST, {'metric_type': metric_type}
+
+    Session = _get_sessionmaker(db_path)
+
+    with Session() as session:
+        row = session.execute(stmt, params).first()
+
+    if row:
+        return dict(row._mapping)
+
+    return None
 
 
 def aggregate_metrics(
@@ -161,85 +428,116 @@ def aggregate_metrics(
     start: Union[datetime, int],
     end: Union[datetime, int],
     agg_func: str = "avg",
-    group_by_minutes: int = 1
+    group_by_minutes: int = 1,
+    resolution: str = "auto",
+    with_datetime: bool = False
 ) -> pd.DataFrame:
     """
     Aggregate metrics over time windows
 
+    Long-range averages are served from the pre-rolled metrics_1m /
+    metrics_1h tables (same "auto" rules as query_range). Those tables
+    hold one average per minute/hour and no min, max or count, so "min",
+    "max" and "sum" always read the raw samples, and cover only the raw
+    retention window (24 hours).
+
     Args:
         db_path: Path to SQLite database
         metric_type: Type of metric
         start: Start time
         end: End time
         agg_func: Aggregation function ("avg", "min", "max", "sum")
-        group_by_minutes: Group by this many minutes
+        group_by_minutes: Group by this many minutes (at least 1)
+        resolution: Source resolution for "avg" ("1s", "1m", "1h", or "auto")
+        with_datetime: Also add a pandas datetime column ("datetime")
 
     Returns:
         DataFrame with aggregated data
     """
-    # Convert datetimes to Unix timestamps
-    if isinstance(start, datetime):
-        start = int(start.timestamp())
-    if isinstance(end, datetime):
-        end = int(end.timestamp())
-
-    db = MetricsDatabase(db_path)
-    session = db.get_session()
-
-    try:
-        # Select aggregation function
-        agg_funcs = {
-            'avg': func.avg,
-            'min': func.min,
-            'max': func.max,
-            'sum': func.sum
-        }
-        
-        if agg_func not in agg_funcs:
-            raise ValueError(f"Invalid aggregation function: {agg_func}")
-
-        agg_col = agg_funcs[agg_func](Metric.value).label('value')
-        
-        # Group by time windows (convert to minutes, then back)
-        time_window = (Metric.timestamp / (group_by_minutes * 60)).cast(Integer) * (group_by_minutes * 60)
-        
-        query = session.query(
-            time_window.label('timestamp'),
-            Metric.metric_type,
-            Metric.host,
-            agg_col
-        ).filter(
-            and_(
-                Metric.metric_type == metric_type,
-                Metric.timestamp >= start,
-                Metric.timestamp <= end
-            )
-        ).group_by(
-            time_window,
-            Metric.metric_type,
-            Metric.host
-        ).order_by(time_window.desc())
-
-        results = query.all()
-        
-        if not results:
-            return pd.DataFrame(columns=['timestamp', 'metric_type', 'host', 'value'])
-
-        data = [{
-            'timestamp': r.timestamp,
-            'metric_type': r.metric_type,
-            'host': r.host,
-            'value': r.value
-        } for r in results]
-
-        df = pd.DataFrame(data)
-        df['datetime'] = pd.to_datetime(df['timestamp'], unit='s')
-        
-        return df
-
-    finally:
-        session.close()
-        db.close()
+    # Convert datetimes (and float timestamps) to integer Unix timestamps
+    start, end = _to_timestamp(start), _to_timestamp(end)
+
+    if agg_func not in _AGG_FUNCS:
+        raise ValueError(f"Invalid aggregation function: {agg_func}")
+    if group_by_minutes < 1:
+        raise ValueError(f"group_by_minutes must be at least 1: {group_by_minutes}")
+
+    if agg_func == 'avg':
+        table_class = _resolution_table(start, end, resolution)
+        if table_class is Metric1h and group_by_minutes % 60:
+            # Hourly rows cannot be split into sub-hour buckets
+            table_class = Metric1m
+    else:
+        # min/max/sum of stored averages would not be those of the samples
+        table_class = Metric
+
+    stmt = _aggregate_statement(table_class, agg_func)
+
+    bucket = group_by_minutes * 60
+    params = {
+        'metric_type': metric_type,
+        'start': start,
+        'end': end,
+        'bucket': bucket,
+        'bucket_start': start - (start % bucket)
+    }
+
+    Session = _get_sessionmaker(db_path)
+
+    with Session() as session:
+        result = session.execute(stmt, params, execution_options={'yield_per': _YIELD_PER})
+        df = _frame_from_result(result)
+
+    if with_datetime:
+        df['datetime'] = pd.to_datetime(df['timestamp'].to_numpy(), unit='s', cache=True)
+
+    return df
+
+
+def get_catalog(db_path: str) -> Dict[str, List[str]]:
+    """
+    Get all metric types and hosts in one round trip
+
+    A single statement walks both indexes with one probe per distinct
+    value (see _distinct_cte), so the cost follows the number of types
+    and hosts rather than the number of stored samples.
+
+    Args:
+        db_path: Path to SQLite database
+
+    Returns:
+        Dictionary with 'metric_types' and 'hosts' lists
+    """
+    Session = _get_sessionmaker(db_path)
+
+    with Session() as session:
+        catalog = {'metric_types': [], 'hosts': []}
+        for key, value in session.execute(_CATALOG):
+            catalog[key].append(value)
+
+    return catalog
+
+
+def _file_version(db_path: str) -> tuple:
+    """
+    Modification stamp of the database and its WAL file
+
+    In WAL mode writes land in the -wal file; the main file only changes
+    at checkpoints, so both are needed to notice new rows.
+    """
+    version = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            version.append(0)
+    return tuple(version)
+
+
+@lru_cache(maxsize=1)
+def _cached_catalog(db_path: str, version: tuple) -> Dict[str, List[str]]:
+    """get_catalog() memoised until the database files change"""
+    return get_catalog(db_path)
 
 
 def get_metric_types(db_path: str) -> List[str]:
@@ -252,16 +550,7 @@ def get_metric_types(db_path: str) -> List[str]:
     Returns:
         List of metric type names
     """
-    db = MetricsDatabase(db_path)
-    session = db.get_session()
-
-    try:
-        results = session.query(Metric.metric_type).distinct().all()
-        return [r[0] for r in results]
-
-    finally:
-        session.close()
-        db.close()
+    return list(_cached_catalog(db_path, _file_version(db_path))['metric_types'])
 
 
 def get_hosts(db_path: str) -> List[str]:
@@ -274,13 +563,4 @@ def get_hosts(db_path: str) -> List[str]:
     Returns:
         List of hostnames
     """
-    db = MetricsDatabase(db_path)
-    session = db.get_session()
-
-    try:
-        results = session.query(Metric.host).distinct().all()
-        return [r[0] for r in results]
-
-    finally:
-        session.close()
-        db.close()
+    return list(_cached_catalog(db_path, _file_version(db_path))['hosts'])
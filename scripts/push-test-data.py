@@ -2,15 +2,41 @@
 """Push test data to aggregator to demonstrate dashboard"""
 
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 AGGREGATOR_URL = "http://localhost:9000"
 AUTH_TOKEN = "sysmon-demo-token-12345"
 
 hosts = ["web-server-01", "db-server-01", "app-server-01"]
 
+# One pooled session for every push (reuses connections where the server
+# keeps them alive)
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=8))
+session.headers.update({
+    "Authorization": f"Bearer {AUTH_TOKEN}",
+    "Content-Type": "application/json"
+})
+
+
+def dumps(data):
+    """Serialize a payload to JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
 def push_metrics(host, cpu_usage, memory_used, memory_total):
     """Push metrics for a host"""
     timestamp = int(time.time())
@@ -30,16 +56,10 @@ def push_metrics(host, cpu_usage, memory_used, memory_total):
         ]
     }
     
-    headers = {
-        "Authorization": f"Bearer {AUTH_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.post(
+        response = session.post(
             f"{AGGREGATOR_URL}/api/metrics",
-            json=data,
-            headers=headers,
+            data=dumps(data),
             timeout=5
         )
         if response.status_code == 200:
@@ -72,16 +92,23 @@ def main():
     
     memory_total = 8192  # 8GB
     
-    for i in range(20):
-        print(f"\n=== Push {i+1}/20 ===")
-        for host in hosts:
-            # Vary metrics slightly
-            cpu = base_cpu[host] + random.uniform(-5, 5)
-            memory = base_memory[host] + random.randint(-200, 200)
+    # The aggregator takes one hostname per request, so hosts are pushed
+    # concurrently rather than merged into one payload
+    with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+        for i in range(20):
+            print(f"\n=== Push {i+1}/20 ===")
+            futures = []
+            for host in hosts:
+                # Vary metrics slightly
+                cpu = base_cpu[host] + random.uniform(-5, 5)
+                memory = base_memory[host] + random.randint(-200, 200)
+                
+                futures.append(executor.submit(push_metrics, host, cpu, memory, memory_total))
+            
+            for future in futures:
+                future.result()
             
-            push_metrics(host, cpu, memory, memory_total)
-        
-        time.sleep(2)
+            time.sleep(2)
     
     print("\n✓ Test data push complete!")
     print(f"\nView dashboard at: {AGGREGATOR_URL}")
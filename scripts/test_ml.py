@@ -11,6 +11,12 @@ import time
 from datetime import datetime, timedelta
 import random
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # Add parent directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
@@ -25,39 +31,42 @@ def generate_mock_data(hours=24, anomaly=False):
         print("Please run sysmond first to create the database.")
         return False
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     # Generate data points (one per minute)
     end_time = int(time.time())
     start_time = end_time - (hours * 3600)
     
-    data_points = []
-    for timestamp in range(start_time, end_time, 60):
+    if NUMPY_AVAILABLE:
+        timestamps = np.arange(start_time, end_time, 60, dtype=np.int64)
         # Normal behavior: oscillate between 20-40%
-        base_value = 30 + 10 * (0.5 + 0.5 * ((timestamp % 3600) / 3600))
-        noise = random.gauss(0, 2)
-        value = base_value + noise
+        values = 30 + 10 * (0.5 + 0.5 * ((timestamps % 3600) / 3600))
+        values += np.random.default_rng().normal(0, 2, timestamps.size)
         
         # Add anomaly in recent data if requested
-        if anomaly and timestamp > end_time - 600:  # Last 10 minutes
-            value += 50  # Spike to 80%+
+        if anomaly:
+            values[timestamps > end_time - 600] += 50  # Spike to 80%+
         
-        data_points.append((
-            timestamp,
-            'cpu.total_usage',
-            'localhost',
-            '{}',
-            value
-        ))
-    
-    # Insert data
-    cursor.executemany("""
-        INSERT OR REPLACE INTO metrics (timestamp, metric_type, host, tags, value)
-        VALUES (?, ?, ?, ?, ?)
-    """, data_points)
-    
-    conn.commit()
+        data_points = list(zip(timestamps.tolist(), values.tolist()))
+    else:
+        data_points = []
+        for timestamp in range(start_time, end_time, 60):
+            base_value = 30 + 10 * (0.5 + 0.5 * ((timestamp % 3600) / 3600))
+            value = base_value + random.gauss(0, 2)
+            if anomaly and timestamp > end_time - 600:
+                value += 50
+            data_points.append((timestamp, value))
+    
+    conn = sqlite3.connect(DB_PATH)
+    # Throwaway test data: skip fsyncs for this bulk load (per connection;
+    # journal_mode is left alone so sysmond's WAL setting stays intact)
+    conn.execute("PRAGMA synchronous=OFF")
+    
+    # Insert data in a single transaction
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO metrics (timestamp, metric_type, host, tags, value)
+            VALUES (?, 'cpu.total_usage', 'localhost', '{}', ?)
+        """, data_points)
+    
     conn.close()
     
     print(f"✓ Generated {len(data_points)} data points")
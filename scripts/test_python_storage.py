@@ -61,7 +61,8 @@ def main():
             metric_type='cpu.total_usage',
             start=start,
             end=end,
-            limit=10
+            limit=10,
+            with_datetime=True
         )
         
         if not df.empty:
@@ -109,7 +110,8 @@ def main():
             start=start,
             end=end,
             agg_func='avg',
-            group_by_minutes=5
+            group_by_minutes=5,
+            with_datetime=True
         )
         
         if not df.empty:
@@ -38,6 +38,17 @@ CREATE INDEX IF NOT EXISTS idx_timestamp ON metrics(timestamp);
 INSERT OR IGNORE INTO schema_version (version, applied_at) VALUES (1, strftime('%s', 'now'));
 )";
 
+// Covering index for per-metric range reads (query API, rollups, baseline
+// learning): they are answered from the index alone. It starts with
+// (metric_type, timestamp), so it replaces idx_metric_time and ingest still
+// maintains three secondary indexes.
+constexpr const char* SCHEMA_VERSION_2 = R"(
+CREATE INDEX IF NOT EXISTS idx_metric_type_ts ON metrics(metric_type, timestamp, host, value);
+DROP INDEX IF EXISTS idx_metric_time;
+
+INSERT OR IGNORE INTO schema_version (version, applied_at) VALUES (2, strftime('%s', 'now'));
+)";
+
 // Get current Unix timestamp in seconds
 int64_t GetCurrentTimestamp() {
     return std::chrono::duration_cast<std::chrono::seconds>(
@@ -121,8 +132,12 @@ void MetricsStorage::InitializeSchema() {
         ExecuteSQL(SCHEMA_VERSION_1);
     }
 
+    if (current_version < 2) {
+        ExecuteSQL(SCHEMA_VERSION_2);
+    }
+
     // Future migrations would go here:
-    // if (current_version < 2) { ExecuteSQL(SCHEMA_VERSION_2); }
+    // if (current_version < 3) { ExecuteSQL(SCHEMA_VERSION_3); }
 }
 
 void MetricsStorage::ExecuteSQL(const std::string& sql) {
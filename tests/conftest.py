@@ -2,29 +2,37 @@
 Pytest configuration and fixtures
 """
 
-import pytest
-import tempfile
-import shutil
 import os
-from pathlib import Path
+import uuid
+
+import pytest
+
+# SYSMON_TEST_INMEM=1 runs database tests against shared-cache in-memory
+# SQLite databases instead of files under tmp_path
+INMEM_DB = os.environ.get("SYSMON_TEST_INMEM") == "1"
 
 @pytest.fixture
-def temp_db():
+def temp_db(tmp_path):
     """Create a temporary database for testing"""
-    temp_dir = tempfile.mkdtemp()
-    db_path = os.path.join(temp_dir, "test.db")
-    yield db_path
-    shutil.rmtree(temp_dir)
+    if INMEM_DB:
+        return f"file:memdb_{uuid.uuid4().hex}?mode=memory&cache=shared"
+    return str(tmp_path / "test.db")
+
+@pytest.fixture(scope="class")
+def class_temp_db(tmp_path_factory):
+    """Create a temporary database shared by the tests of one class"""
+    if INMEM_DB:
+        return f"file:memdb_{uuid.uuid4().hex}?mode=memory&cache=shared"
+    return str(tmp_path_factory.mktemp("db") / "test.db")
 
 @pytest.fixture
-def temp_config():
+def temp_config(tmp_path):
     """Create a temporary config file"""
-    temp_dir = tempfile.mkdtemp()
-    config_path = os.path.join(temp_dir, "config.yaml")
-    yield config_path
-    shutil.rmtree(temp_dir)
+    return str(tmp_path / "config.yaml")
 
-@pytest.fixture
+# Sample metrics are plain data shared by the whole session; tests that
+# need a variant take a .copy() first
+@pytest.fixture(scope="session")
 def sample_cpu_metrics():
     """Sample CPU metrics for testing"""
     return {
@@ -35,7 +43,7 @@ def sample_cpu_metrics():
         "tags": {}
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_memory_metrics():
     """Sample memory metrics for testing"""
     return {
@@ -46,7 +54,7 @@ def sample_memory_metrics():
         "tags": {}
     }
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def aggregator_port():
     """Get available port for aggregator testing"""
     return 19999  # Use high port for testing
@@ -3,69 +3,243 @@ Load testing for aggregator
 Simulates multiple agents sending metrics concurrently
 """
 
+import cProfile
+import os
+import pstats
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import random
 import json
-from multiprocessing import Process, Value, Array
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process, Array
+import multiprocessing.connection as mpc
 from datetime import datetime
 import sys
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# Simulated agents hosted (as threads) by each worker process; the work is
+# network-bound, so a few hundred threads share one interpreter comfortably
+AGENTS_PER_PROCESS = 500
+
+# Per-agent counter slot: 8 int64s = one 64-byte cache line, so agents in
+# different processes never write to the same line. Latencies and client
+# timings are integer nanoseconds from perf_counter_ns.
+SLOT_WIDTH = 8
+(SENT, FAILED, TOTAL_LATENCY, MAX_LATENCY, MIN_LATENCY,
+ BATCHES, GENERATE_TIME, SCHEDULE_LAG) = range(8)
+NO_LATENCY = 2 ** 62
+
+
+def dumps(data):
+    """Serialize a payload to JSON bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
 
 class LoadTestMetrics:
-    """Shared metrics across processes"""
-    def __init__(self):
-        self.requests_sent = Value('i', 0)
-        self.requests_failed = Value('i', 0)
-        self.total_latency = Value('d', 0.0)
-        self.max_latency = Value('d', 0.0)
-        self.min_latency = Value('d', 999.0)
+    """
+    Shared metrics across processes
+    
+    Every agent owns one padded slot and is its only writer, so updates
+    need no lock; totals are reduced across slots when read.
+    """
+    def __init__(self, num_agents):
+        self.num_agents = num_agents
+        self.slots = Array('q', num_agents * SLOT_WIDTH, lock=False)
+        self.slots[MIN_LATENCY::SLOT_WIDTH] = [NO_LATENCY] * num_agents
+    
+    def record(self, agent_id, latency_ns, failed=False):
+        """Record one request attempt for an agent (errors count as failed)"""
+        base = agent_id * SLOT_WIDTH
+        slots = self.slots
+        slots[base + SENT] += 1
+        slots[base + TOTAL_LATENCY] += latency_ns
+        if latency_ns > slots[base + MAX_LATENCY]:
+            slots[base + MAX_LATENCY] = latency_ns
+        if latency_ns < slots[base + MIN_LATENCY]:
+            slots[base + MIN_LATENCY] = latency_ns
+        if failed:
+            slots[base + FAILED] += 1
+    
+    def record_batch(self, agent_id, generate_ns, lag_ns):
+        """
+        Record client-side time for one generated batch
+        
+        `generate_ns` is wall time spent rendering it (including waits for
+        the GIL), `lag_ns` how late the agent was for its next scheduled
+        batch.
+        """
+        base = agent_id * SLOT_WIDTH
+        slots = self.slots
+        slots[base + BATCHES] += 1
+        slots[base + GENERATE_TIME] += generate_ns
+        slots[base + SCHEDULE_LAG] += lag_ns
+    
+    def _column(self, field):
+        return self.slots[field::SLOT_WIDTH]
+    
+    @property
+    def requests_sent(self):
+        return sum(self._column(SENT))
+    
+    @property
+    def requests_failed(self):
+        return sum(self._column(FAILED))
+    
+    @property
+    def total_latency_ns(self):
+        return sum(self._column(TOTAL_LATENCY))
+    
+    @property
+    def max_latency_ns(self):
+        return max(self._column(MAX_LATENCY))
+    
+    @property
+    def min_latency_ns(self):
+        latency = min(self._column(MIN_LATENCY))
+        return 0 if latency == NO_LATENCY else latency
+    
+    @property
+    def batches(self):
+        return sum(self._column(BATCHES))
+    
+    @property
+    def generate_time_ns(self):
+        return sum(self._column(GENERATE_TIME))
+    
+    @property
+    def schedule_lag_ns(self):
+        return sum(self._column(SCHEDULE_LAG))
 
 
 class AgentSimulator:
     """Simulates a single agent sending metrics"""
     
-    def __init__(self, agent_id, aggregator_url, metrics_obj, duration=60):
+    # Metric type -> range of generated values
+    METRIC_TYPES = {
+        "cpu.total_usage": (10.0, 90.0),
+        "memory.usage_percent": (30.0, 80.0),
+        "disk.usage_percent": (40.0, 70.0),
+    }
+    
+    def __init__(self, agent_id, aggregator_url, metrics_obj, duration=60, rps=1.0, coalesce=1):
         self.agent_id = agent_id
         self.aggregator_url = aggregator_url
         self.metrics = metrics_obj
         self.duration = duration
+        # Seconds between batches; 0 generates back-to-back
+        self.period = 1.0 / rps if rps > 0 else 0.0
+        # Batches merged into each POST. Merging stays within one agent:
+        # the aggregator takes a single hostname per request.
+        self.coalesce = max(1, coalesce)
         self.hostname = f"load-test-agent-{agent_id}"
+        
+        # One pooled keep-alive session per agent, so each batch reuses the
+        # TCP connection instead of reconnecting
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+        self.session.headers['Content-Type'] = 'application/json'
+        token = os.environ.get('SYSMON_AGGREGATOR_TOKEN')
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+        
+        # The batch layout never changes; generate_metrics only rewrites
+        # timestamps and values. The aggregator stores tags as a JSON string.
+        self._tags = json.dumps({"agent_id": str(agent_id)})
+        self._template = []
+        self._ranges = []
+        self._payload_count = None
+        self._payload_format = None
+        self._payload_fields = None
+        self._payload_prefix = b'{"hostname":%s,"metrics":[' % dumps(self.hostname)
     
     def generate_metrics(self, count=10):
-        """Generate fake metrics"""
+        """Generate fake metrics, refreshing the precomputed batch in place"""
+        if len(self._template) != len(self.METRIC_TYPES) * count:
+            self._template = [
+                {
+                    "timestamp": 0,
+                    "metric_type": metric_type,
+                    "value": 0.0,
+                    "tags": self._tags
+                }
+                for metric_type in self.METRIC_TYPES
+                for _ in range(count)
+            ]
+            self._ranges = [self.METRIC_TYPES[m["metric_type"]] for m in self._template]
+        
         now = int(time.time())
-        metrics = []
+        uniform = random.uniform
+        for metric, (low, high) in zip(self._template, self._ranges):
+            metric["timestamp"] = now
+            metric["value"] = uniform(low, high)
         
-        for i in range(count):
-            # CPU metrics
-            metrics.append({
-                "timestamp": now,
-                "metric_type": "cpu.total_usage",
-                "host": self.hostname,
-                "value": random.uniform(10.0, 90.0),
-                "tags": {"agent_id": str(self.agent_id)}
-            })
+        return self._template
+    
+    def generate_payload(self, count=10):
+        """
+        Generate the JSON request body for one batch
+        
+        Same document as dumps({"hostname": ..., "metrics": generate_metrics(count)}),
+        but rendered from a %-format built once per agent with only the
+        timestamps and values (two decimals) left open, so no encoder
+        runs per batch.
+        """
+        return self._wrap_entries([self.generate_entries(count)])
+    
+    def generate_entries(self, count=10):
+        """Render one batch as the comma-joined entries of a metrics array"""
+        if self._payload_count != count:
+            self.generate_metrics(count)
             
-            # Memory metrics
-            metrics.append({
-                "timestamp": now,
-                "metric_type": "memory.usage_percent",
-                "host": self.hostname,
-                "value": random.uniform(30.0, 80.0),
-                "tags": {"agent_id": str(self.agent_id)}
-            })
+            def literal(value):
+                return dumps(value).decode("utf-8").replace("%", "%%")
             
-            # Disk metrics
-            metrics.append({
-                "timestamp": now,
-                "metric_type": "disk.usage_percent",
-                "host": self.hostname,
-                "value": random.uniform(40.0, 70.0),
-                "tags": {"agent_id": str(self.agent_id)}
-            })
+            self._payload_format = ",".join(
+                '{"timestamp":%%d,"metric_type":%s,"value":%%.2f,"tags":%s}'
+                % (literal(m["metric_type"]), literal(self._tags))
+                for m in self._template
+            )
+            # Alternating timestamp/value arguments, rewritten in place
+            self._payload_fields = [0, 0.0] * len(self._template)
+            self._payload_count = count
+        
+        uniform = random.uniform
+        fields = self._payload_fields
+        fields[0::2] = [int(time.time())] * len(self._ranges)
+        fields[1::2] = [uniform(low, high) for low, high in self._ranges]
         
-        return metrics
+        return self._payload_format % tuple(fields)
+    
+    def _wrap_entries(self, batches):
+        """Build one request body from rendered batches of this agent"""
+        return b"".join((self._payload_prefix, ",".join(batches).encode("utf-8"), b"]}"))
+    
+    def _send(self, body):
+        """POST one request body and record the outcome"""
+        request_start = time.perf_counter_ns()
+        try:
+            response = self.session.post(
+                f"{self.aggregator_url}/api/metrics",
+                data=body,
+                timeout=5.0
+            )
+            failed = response.status_code != 200
+        except Exception as e:
+            failed = True
+            print(f"Agent {self.agent_id} error: {e}")
+        request_ns = time.perf_counter_ns() - request_start
+        
+        # Update this agent's slot (no lock, single writer)
+        self.metrics.record(self.agent_id, request_ns, failed)
     
     def run(self):
         """Run agent simulation"""
@@ -73,51 +247,124 @@ class AgentSimulator:
         
         print(f"Agent {self.agent_id} started")
         
+        pending = []
+        next_deadline = time.monotonic()
         while time.time() - start_time < self.duration:
-            try:
-                # Generate and send metrics
-                metrics = self.generate_metrics(count=10)
-                
-                request_start = time.time()
-                response = requests.post(
-                    f"{self.aggregator_url}/api/metrics",
-                    json=metrics,
-                    timeout=5.0
-                )
-                request_time = time.time() - request_start
-                
-                # Update shared metrics
-                with self.metrics.requests_sent.get_lock():
-                    self.metrics.requests_sent.value += 1
-                
-                with self.metrics.total_latency.get_lock():
-                    self.metrics.total_latency.value += request_time
-                
-                with self.metrics.max_latency.get_lock():
-                    if request_time > self.metrics.max_latency.value:
-                        self.metrics.max_latency.value = request_time
-                
-                with self.metrics.min_latency.get_lock():
-                    if request_time < self.metrics.min_latency.value:
-                        self.metrics.min_latency.value = request_time
-                
-                if response.status_code != 200:
-                    with self.metrics.requests_failed.get_lock():
-                        self.metrics.requests_failed.value += 1
-                
-            except Exception as e:
-                with self.metrics.requests_failed.get_lock():
-                    self.metrics.requests_failed.value += 1
-                print(f"Agent {self.agent_id} error: {e}")
+            next_deadline += self.period
+            
+            # Generate metrics; send once `coalesce` batches are queued
+            generate_start = time.perf_counter_ns()
+            pending.append(self.generate_entries(count=10))
+            generate_ns = time.perf_counter_ns() - generate_start
+            if len(pending) >= self.coalesce:
+                self._send(self._wrap_entries(pending))
+                pending.clear()
             
-            # Wait before next batch
-            time.sleep(1.0)
+            # Wait for the next slot on the schedule; a late request eats
+            # into the wait instead of shifting every later batch
+            delay = next_deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            
+            # (no schedule to lag behind when running unthrottled)
+            lag_ns = int(-delay * 1e9) if delay < 0 and self.period else 0
+            self.metrics.record_batch(self.agent_id, generate_ns, lag_ns)
+        
+        if pending:
+            self._send(self._wrap_entries(pending))
         
+        self.session.close()
         print(f"Agent {self.agent_id} completed")
 
 
-def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:9000"):
-    """Run load test with multiple simulated agents"""
+def _profiled(func, profiles):
+    """Run func under its own cProfile profiler (profilers are per-thread)"""
+    profiler = cProfile.Profile()
+    profiles.append(profiler)
+    profiler.runcall(func)
+
+
+def run_agent_group(agent_ids, aggregator_url, metrics, duration, rps=1.0, coalesce=1,
+                    profile_path=None):
+    """
+    Worker process: run a group of agents on threads
+    
+    The agents spend nearly all their time waiting on the network, so one
+    process multiplexes many of them. With `profile_path`, every agent
+    thread is profiled and the merged stats are written there.
+    """
+    agents = [AgentSimulator(i, aggregator_url, metrics, duration, rps, coalesce)
+              for i in agent_ids]
+    profiles = []
+    with ThreadPoolExecutor(max_workers=len(agents)) as executor:
+        futures = []
+        for n, agent in enumerate(agents):
+            if profile_path:
+                futures.append(executor.submit(_profiled, agent.run, profiles))
+            else:
+                futures.append(executor.submit(agent.run))
+            
+            # Stagger starts slightly so the first batches don't all hit the
+            # aggregator's listen backlog at once
+            if n % 10 == 0:
+                time.sleep(0.1)
+        
+        for future in futures:
+            future.result()
+    
+    if profiles:
+        pstats.Stats(*profiles).dump_stats(profile_path)
+
+
+def start_agents(first_id, num_agents, aggregator_url, metrics, duration, rps=1.0, coalesce=1,
+                 profile_path=None):
+    """
+    Start worker processes for agents first_id .. first_id+num_agents-1
+    
+    `rps` is the batch rate of each agent (0 = as fast as possible), and
+    every `coalesce` batches go out as one request. If `profile_path` is
+    given, the first process profiles its agents into that pstats file.
+    """
+    processes = []
+    for start in range(first_id, first_id + num_agents, AGENTS_PER_PROCESS):
+        agent_ids = range(start, min(start + AGENTS_PER_PROCESS, first_id + num_agents))
+        p = Process(target=run_agent_group, args=(agent_ids, aggregator_url, metrics, duration,
+                                                          rps, coalesce, profile_path))
+        profile_path = None
+        p.start()
+        processes.append(p)
+    return processes
+
+
+def wait_for_agents(processes, timeout=10):
+    """Join worker processes, terminating any still running after `timeout` seconds"""
+    # Wait on every process sentinel at once, reaping each as it exits
+    pending = {p.sentinel: p for p in processes}
+    deadline = time.monotonic() + timeout
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        for sentinel in mpc.wait(list(pending), timeout=remaining):
+            pending.pop(sentinel).join()
+    
+    for p in pending.values():
+        p.terminate()
+        p.join()
+
+
+def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:9000", rps=None,
+                  coalesce=1, profile_path=None):
+    """
+    Run load test with multiple simulated agents
+    
+    `rps` is the total target batch rate, split evenly across agents;
+    None keeps one batch per agent per second, 0 removes the limit. Each
+    agent merges every `coalesce` batches into one request. `profile_path`
+    writes a cProfile dump of the first worker process.
+    """
+    if rps is None:
+        rps = num_agents
     
     print("=" * 70)
     print("SysMonitor Aggregator Load Test")
@@ -125,6 +372,8 @@ def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:
     print(f"Configuration:")
     print(f"  Agents: {num_agents}")
     print(f"  Duration: {duration} seconds")
+    print(f"  Target rate: {f'{rps} batches/s' if rps > 0 else 'unlimited'}")
+    print(f"  Batches per request: {coalesce}")
     print(f"  Aggregator: {aggregator_url}")
     print(f"  Started: {datetime.now()}")
     print("=" * 70)
@@ -141,21 +390,14 @@ def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:
         return
     
     # Create shared metrics object
-    metrics = LoadTestMetrics()
+    metrics = LoadTestMetrics(num_agents)
     
-    # Start agent processes
-    processes = []
-    for i in range(num_agents):
-        agent = AgentSimulator(i, aggregator_url, metrics, duration)
-        p = Process(target=agent.run)
-        p.start()
-        processes.append(p)
-        
-        # Stagger starts slightly to avoid thundering herd
-        if i % 10 == 0:
-            time.sleep(0.1)
+    # Start worker processes, each hosting a group of agents
+    processes = start_agents(0, num_agents, aggregator_url, metrics, duration,
+                             rps / num_agents, coalesce, profile_path)
     
-    print(f"\n{num_agents} agents started, running for {duration} seconds...")
+    print(f"\n{num_agents} agents started in {len(processes)} processes, "
+          f"running for {duration} seconds...")
     
     # Monitor progress
     start_time = time.time()
@@ -163,8 +405,8 @@ def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:
         while time.time() - start_time < duration:
             elapsed = int(time.time() - start_time)
             print(f"\rProgress: {elapsed}/{duration}s | "
-                  f"Requests: {metrics.requests_sent.value} | "
-                  f"Failed: {metrics.requests_failed.value}",
+                  f"Requests: {metrics.requests_sent} | "
+                  f"Failed: {metrics.requests_failed}",
                   end='', flush=True)
             time.sleep(1)
     except KeyboardInterrupt:
@@ -172,18 +414,15 @@ def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:
     
     # Wait for all processes to complete
     print("\n\nWaiting for agents to complete...")
-    for p in processes:
-        p.join(timeout=10)
-        if p.is_alive():
-            p.terminate()
+    wait_for_agents(processes)
     
     # Calculate statistics
-    total_requests = metrics.requests_sent.value
-    failed_requests = metrics.requests_failed.value
+    total_requests = metrics.requests_sent
+    failed_requests = metrics.requests_failed
     success_requests = total_requests - failed_requests
     
     if total_requests > 0:
-        avg_latency = metrics.total_latency.value / total_requests
+        avg_latency = metrics.total_latency_ns / total_requests / 1e9
         success_rate = (success_requests / total_requests) * 100
     else:
         avg_latency = 0
@@ -203,8 +442,17 @@ def run_load_test(num_agents=100, duration=60, aggregator_url="http://localhost:
     print(f"Duration:           {duration}s")
     print(f"Throughput:         {throughput:.2f} req/s")
     print(f"Average latency:    {avg_latency*1000:.2f}ms")
-    print(f"Min latency:        {metrics.min_latency.value*1000:.2f}ms")
-    print(f"Max latency:        {metrics.max_latency.value*1000:.2f}ms")
+    print(f"Min latency:        {metrics.min_latency_ns / 1e6:.2f}ms")
+    print(f"Max latency:        {metrics.max_latency_ns / 1e6:.2f}ms")
+    
+    # Client-side accounting: is the generator itself the bottleneck?
+    batches = metrics.batches
+    if batches > 0:
+        agent_time_ns = num_agents * duration * 1e9
+        print(f"Client generate:    {metrics.generate_time_ns / agent_time_ns * 100:.2f}% of agent time")
+        print(f"Schedule lag:       {metrics.schedule_lag_ns / batches / 1e6:.2f}ms per batch")
+    if profile_path:
+        print(f"Profile:            {profile_path} (first worker process)")
     print("=" * 70)
     
     # Performance assessment
@@ -238,59 +486,35 @@ def run_spike_test(aggregator_url="http://localhost:9000"):
     print("Spike Test: Sudden Traffic Burst")
     print("=" * 70)
     
-    metrics = LoadTestMetrics()
+    metrics = LoadTestMetrics(120)
     
     # Phase 1: Normal load (10 agents)
     print("Phase 1: Normal load (10 agents) for 10s...")
-    processes = []
-    for i in range(10):
-        agent = AgentSimulator(i, aggregator_url, metrics, duration=10)
-        p = Process(target=agent.run)
-        p.start()
-        processes.append(p)
+    wait_for_agents(start_agents(0, 10, aggregator_url, metrics, 10),
+                    timeout=20)
     
-    time.sleep(10)
-    for p in processes:
-        p.join()
-    
-    phase1_requests = metrics.requests_sent.value
+    phase1_requests = metrics.requests_sent
     print(f"Phase 1 complete: {phase1_requests} requests")
     
     # Phase 2: Spike (100 agents)
     print("\nPhase 2: SPIKE (100 agents) for 20s...")
-    processes = []
-    for i in range(100):
-        agent = AgentSimulator(i + 10, aggregator_url, metrics, duration=20)
-        p = Process(target=agent.run)
-        p.start()
-        processes.append(p)
+    wait_for_agents(start_agents(10, 100, aggregator_url, metrics, 20),
+                    timeout=30)
     
-    time.sleep(20)
-    for p in processes:
-        p.join()
-    
-    phase2_requests = metrics.requests_sent.value - phase1_requests
+    phase2_requests = metrics.requests_sent - phase1_requests
     print(f"Phase 2 complete: {phase2_requests} requests")
     
     # Phase 3: Back to normal (10 agents)
     print("\nPhase 3: Back to normal (10 agents) for 10s...")
-    processes = []
-    for i in range(10):
-        agent = AgentSimulator(i + 110, aggregator_url, metrics, duration=10)
-        p = Process(target=agent.run)
-        p.start()
-        processes.append(p)
-    
-    time.sleep(10)
-    for p in processes:
-        p.join()
+    wait_for_agents(start_agents(110, 10, aggregator_url, metrics, 10),
+                    timeout=20)
     
-    phase3_requests = metrics.requests_sent.value - phase1_requests - phase2_requests
+    phase3_requests = metrics.requests_sent - phase1_requests - phase2_requests
     print(f"Phase 3 complete: {phase3_requests} requests")
     
     # Results
-    total_requests = metrics.requests_sent.value
-    failed_requests = metrics.requests_failed.value
+    total_requests = metrics.requests_sent
+    failed_requests = metrics.requests_failed
     success_rate = ((total_requests - failed_requests) / total_requests * 100) if total_requests > 0 else 0
     
     print("\n" + "=" * 70)
@@ -308,16 +532,41 @@ def run_spike_test(aggregator_url="http://localhost:9000"):
 
 if __name__ == "__main__":
     import argparse
+    import multiprocessing as mp
+    
+    # fork starts workers without re-importing anything; where it is not
+    # the safe default, a forkserver with the heavy imports preloaded is
+    # the next best thing (spawn only on platforms without either)
+    if sys.platform.startswith("linux"):
+        mp.set_start_method("fork")
+    elif "forkserver" in mp.get_all_start_methods():
+        mp.set_start_method("forkserver")
+        mp.set_forkserver_preload(["requests", "json", "random"])
     
     parser = argparse.ArgumentParser(description="Load test for SysMonitor aggregator")
     parser.add_argument("--agents", type=int, default=100, help="Number of simulated agents")
     parser.add_argument("--duration", type=int, default=60, help="Test duration in seconds")
     parser.add_argument("--url", default="http://localhost:9000", help="Aggregator URL")
+    parser.add_argument("--rps", type=float, default=None,
+                        help="Total target batches/s (default: 1 per agent, 0 = unlimited)")
+    parser.add_argument("--coalesce", type=int, default=1,
+                        help="Batches each agent merges into one request")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Write a cProfile dump of the first worker process to PATH")
     parser.add_argument("--spike", action="store_true", help="Run spike test instead")
+    parser.add_argument("--token", help="Aggregator auth token (default: $SYSMON_AGGREGATOR_TOKEN)")
     
     args = parser.parse_args()
+    if args.agents < 1:
+        # Per-agent rates and the report divide by the agent count
+        parser.error("--agents must be at least 1")
+    
+    # Worker processes inherit the environment, so agents pick the token up there
+    if args.token:
+        os.environ['SYSMON_AGGREGATOR_TOKEN'] = args.token
     
     if args.spike:
         run_spike_test(args.url)
     else:
-        run_load_test(args.agents, args.duration, args.url)
+        run_load_test(args.agents, args.duration, args.url, args.rps, args.coalesce,
+                      args.profile)
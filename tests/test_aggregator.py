@@ -7,6 +7,7 @@ import requests
 import json
 import time
 from multiprocessing import Process
+import sqlite3
 import sys
 import os
 
@@ -16,32 +17,67 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'python'))
 from sysmon.aggregator.server import AggregatorServer
 
 
+def _run_server(port, db_path):
+    server = AggregatorServer(port=port, db_path=db_path)
+    server.start()
+
+
+def _wait_until_healthy(base_url, timeout=10.0):
+    """Poll /health until the server answers or `timeout` seconds pass"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=0.5).status_code == 200:
+                return True
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture(scope="session")
+def live_server(tmp_path_factory, aggregator_port):
+    """Aggregator server started once for the whole session"""
+    db_path = str(tmp_path_factory.mktemp("aggregator") / "test.db")
+    base_url = f"http://localhost:{aggregator_port}"
+    
+    server_process = Process(target=_run_server, args=(aggregator_port, db_path))
+    server_process.start()
+    
+    if not _wait_until_healthy(base_url):
+        server_process.terminate()
+        server_process.join(timeout=5)
+        pytest.fail("Aggregator server did not become healthy")
+    
+    yield base_url, db_path
+    
+    # Cleanup
+    server_process.terminate()
+    server_process.join(timeout=5)
+
+
+# Every test talks to the one live server on a fixed port, so under
+# pytest-xdist (--dist=loadgroup) the whole class stays on a single worker
+@pytest.mark.xdist_group("server")
 class TestAggregatorAPI:
     """Test suite for aggregator API"""
     
     @pytest.fixture(autouse=True)
-    def setup(self, temp_db, aggregator_port):
-        """Start aggregator server for tests"""
-        self.port = aggregator_port
-        self.base_url = f"http://localhost:{self.port}"
-        self.db_path = temp_db
+    def setup(self, live_server):
+        """Point tests at the shared server and empty its database"""
+        self.base_url, self.db_path = live_server
         
-        # Start server in background
-        def run_server():
-            server = AggregatorServer(port=self.port, db_path=self.db_path)
-            server.start()
-        
-        self.server_process = Process(target=run_server)
-        self.server_process.start()
-        
-        # Wait for server to start
-        time.sleep(2)
-        
-        yield
-        
-        # Cleanup
-        self.server_process.terminate()
-        self.server_process.join(timeout=5)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master "
+                "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+            )]
+            with conn:
+                for table in tables:
+                    conn.execute(f'DELETE FROM "{table}"')
+        finally:
+            conn.close()
     
     def test_health_endpoint(self):
         """Test /health endpoint"""
@@ -66,15 +102,16 @@ class TestAggregatorAPI:
     
     def test_metrics_endpoint_batch(self):
         """Test batch metric ingestion"""
-        metrics = []
-        for i in range(10):
-            metrics.append({
+        metrics = [
+            {
                 "timestamp": 1234567890 + i,
                 "metric_type": "cpu.total_usage",
                 "host": "test-host",
                 "value": 40.0 + i,
                 "tags": {}
-            })
+            }
+            for i in range(10)
+        ]
         
         response = requests.post(
             f"{self.base_url}/api/metrics",
@@ -133,11 +170,9 @@ class TestAggregatorAPI:
     
     def test_hosts_endpoint(self, sample_cpu_metrics):
         """Test /api/hosts endpoint"""
-        # Insert metrics from multiple hosts
-        for host in ["host-1", "host-2", "host-3"]:
-            metric = sample_cpu_metrics.copy()
-            metric["host"] = host
-            requests.post(f"{self.base_url}/api/metrics", json=[metric])
+        # Insert metrics from multiple hosts in one batch
+        metrics = [{**sample_cpu_metrics, "host": host} for host in ["host-1", "host-2", "host-3"]]
+        requests.post(f"{self.base_url}/api/metrics", json=metrics)
         
         time.sleep(0.5)
         
@@ -13,6 +13,19 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'python'))
 from sysmon.ml.anomaly_detector import AnomalyDetector, IsolationForestDetector
 from sysmon.ml.predictor import MetricsPredictor
 
+@pytest.fixture
+def rng():
+    """Freshly seeded PCG64 generator per test, so each test's data is fixed"""
+    return np.random.default_rng(0)
+
+
+@pytest.fixture(scope="module")
+def trained_detector():
+    """Detector trained once on N(50, 5) data, shared by read-only tests"""
+    detector = IsolationForestDetector(contamination=0.1)
+    detector.train(np.random.default_rng(0).normal(50, 5, (1000, 1)))
+    return detector
+
 
 class TestAnomalyDetector:
     """Test suite for anomaly detection"""
@@ -22,23 +35,19 @@ class TestAnomalyDetector:
         detector = IsolationForestDetector(contamination=0.1)
         assert detector is not None
     
-    def test_train_detector(self):
+    def test_train_detector(self, rng):
         """Test training anomaly detector"""
         detector = IsolationForestDetector(contamination=0.1)
         
         # Generate normal training data
-        normal_data = np.random.normal(50, 10, (1000, 1))
+        normal_data = rng.normal(50, 10, (1000, 1))
         
         detector.train(normal_data)
         assert detector.is_trained()
     
-    def test_detect_anomalies(self):
+    def test_detect_anomalies(self, trained_detector):
         """Test anomaly detection"""
-        detector = IsolationForestDetector(contamination=0.1)
-        
-        # Train on normal data
-        normal_data = np.random.normal(50, 5, (1000, 1))
-        detector.train(normal_data)
+        detector = trained_detector
         
         # Test with normal and anomalous data
         test_normal = np.array([[50.0], [52.0], [48.0]])
@@ -53,28 +62,22 @@ class TestAnomalyDetector:
         # Anomalous data should mostly be classified as anomalies (-1)
         assert np.mean(anomaly_predictions == -1) > 0.3
     
-    def test_get_anomaly_scores(self):
+    def test_get_anomaly_scores(self, trained_detector):
         """Test getting anomaly scores"""
-        detector = IsolationForestDetector(contamination=0.1)
-        
-        # Train
-        normal_data = np.random.normal(50, 5, (1000, 1))
-        detector.train(normal_data)
-        
         # Get scores
         test_data = np.array([[50.0], [95.0]])
-        scores = detector.get_anomaly_scores(test_data)
+        scores = trained_detector.get_anomaly_scores(test_data)
         
         assert len(scores) == 2
         # Anomalous point should have more negative score
         assert scores[1] < scores[0]
     
-    def test_multivariate_detection(self):
+    def test_multivariate_detection(self, rng):
         """Test anomaly detection with multiple features"""
         detector = IsolationForestDetector(contamination=0.1)
         
         # Multi-dimensional normal data
-        normal_data = np.random.normal(50, 10, (1000, 3))
+        normal_data = rng.normal(50, 10, (1000, 3))
         detector.train(normal_data)
         
         # Test data
@@ -83,13 +86,9 @@ class TestAnomalyDetector:
         
         assert len(predictions) == 2
     
-    def test_save_load_model(self, tmp_path):
+    def test_save_load_model(self, trained_detector, tmp_path):
         """Test saving and loading trained model"""
-        detector = IsolationForestDetector(contamination=0.1)
-        
-        # Train
-        normal_data = np.random.normal(50, 5, (1000, 1))
-        detector.train(normal_data)
+        detector = trained_detector
         
         # Save
         model_path = tmp_path / "model.pkl"
@@ -141,11 +140,11 @@ class TestMetricsPredictor:
         # Should follow trend
         assert predictions[0] > data[-1]
     
-    def test_predict_with_confidence(self):
+    def test_predict_with_confidence(self, rng):
         """Test prediction with confidence intervals"""
         predictor = MetricsPredictor(window_size=10)
         
-        data = np.random.normal(50, 5, 100)
+        data = rng.normal(50, 5, 100)
         predictor.train(data)
         
         predictions, lower, upper = predictor.predict_with_confidence(steps=5)
@@ -171,17 +170,17 @@ class TestMetricsPredictor:
         predictions = predictor.predict(steps=24)
         assert len(predictions) == 24
     
-    def test_trend_detection(self):
+    def test_trend_detection(self, rng):
         """Test detecting trends in data"""
         predictor = MetricsPredictor(window_size=10)
         
         # Upward trend
-        upward_data = np.arange(100).astype(float) + np.random.normal(0, 1, 100)
+        upward_data = np.arange(100).astype(float) + rng.normal(0, 1, 100)
         trend = predictor.detect_trend(upward_data)
         assert trend > 0  # Positive trend
         
         # Downward trend
-        downward_data = -np.arange(100).astype(float) + np.random.normal(0, 1, 100)
+        downward_data = -np.arange(100).astype(float) + rng.normal(0, 1, 100)
         trend = predictor.detect_trend(downward_data)
         assert trend < 0  # Negative trend
 
@@ -189,16 +188,22 @@ class TestMetricsPredictor:
 class TestIntegration:
     """Integration tests for ML components"""
     
-    def test_anomaly_detection_on_real_metrics(self):
+    def test_anomaly_detection_on_real_metrics(self, rng):
         """Test anomaly detection on realistic metric data"""
         detector = IsolationForestDetector(contamination=0.1)
         
         # Simulate CPU usage: normal around 30-50%, with occasional spikes
-        normal_usage = np.random.normal(40, 5, (900, 1))
-        spike_usage = np.random.uniform(80, 95, (100, 1))
-        
-        all_data = np.vstack([normal_usage, spike_usage])
-        np.random.shuffle(all_data)
+        # (filled in place: 900 samples of N(40, 5), then 100 of U(80, 95))
+        all_data = np.empty((1000, 1), dtype=np.float64)
+        normal_usage = all_data[:900]
+        spike_usage = all_data[900:]
+        rng.standard_normal(out=normal_usage)
+        normal_usage *= 5
+        normal_usage += 40
+        rng.random(out=spike_usage)
+        spike_usage *= 15
+        spike_usage += 80
+        rng.shuffle(all_data)
         
         # Train on first 80%
         train_size = int(0.8 * len(all_data))
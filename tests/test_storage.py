@@ -14,18 +14,33 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'python'))
 from sysmon.storage.metrics_db import MetricsDatabase
 
 
+# One MetricsDatabase per test class: opening it runs the schema setup and
+# connection PRAGMAs, so tests share it and only wipe the rows in between
+@pytest.fixture(scope="class")
+def db(class_temp_db):
+    """MetricsDatabase shared by the tests of one class"""
+    database = MetricsDatabase(class_temp_db)
+    yield database
+    database.close()
+
+
+@pytest.fixture(autouse=True)
+def wipe(db):
+    """Start every test from an empty database"""
+    db.clear()
+
+
 class TestMetricsDatabase:
     """Test suite for MetricsDatabase"""
     
-    def test_create_database(self, temp_db):
+    def test_create_database(self, db):
         """Test database creation"""
-        db = MetricsDatabase(temp_db)
-        assert os.path.exists(temp_db)
+        if db.db_path.startswith("file:"):
+            pytest.skip("in-memory database has no file")
+        assert os.path.exists(db.db_path)
     
-    def test_insert_metric(self, temp_db, sample_cpu_metrics):
+    def test_insert_metric(self, db, sample_cpu_metrics):
         """Test inserting a single metric"""
-        db = MetricsDatabase(temp_db)
-        
         result = db.insert_metric(
             timestamp=sample_cpu_metrics["timestamp"],
             metric_type=sample_cpu_metrics["metric_type"],
@@ -36,57 +51,47 @@ class TestMetricsDatabase:
         
         assert result is True
     
-    def test_insert_metrics_batch(self, temp_db):
+    def test_insert_metrics_batch(self, db):
         """Test batch insert"""
-        db = MetricsDatabase(temp_db)
-        
-        metrics = []
-        for i in range(100):
-            metrics.append({
-                "timestamp": 1234567890 + i,
-                "metric_type": "cpu.total_usage",
-                "host": "test-host",
-                "value": 40.0 + i,
-                "tags": {}
-            })
+        base = {"metric_type": "cpu.total_usage", "host": "test-host", "tags": {}}
+        metrics = [{**base, "timestamp": 1234567890 + i, "value": 40.0 + i} for i in range(100)]
         
-        result = db.insert_metrics_batch(metrics)
+        # Only the count is checked, so load without index maintenance
+        with db.bulk_load_context():
+            result = db.insert_metrics_batch(metrics)
         assert result is True
         
         # Verify count
         count = db.get_metric_count("cpu.total_usage")
         assert count == 100
     
-    def test_query_latest(self, temp_db, sample_cpu_metrics):
+    def test_query_latest(self, db, sample_cpu_metrics):
         """Test querying latest metrics"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert multiple metrics
-        for i in range(5):
-            metric = sample_cpu_metrics.copy()
-            metric["timestamp"] = 1234567890 + i
-            metric["value"] = 40.0 + i
-            db.insert_metric(**metric)
+        db.insert_metrics_batch([
+            {**sample_cpu_metrics, "timestamp": 1234567890 + i, "value": 40.0 + i}
+            for i in range(5)
+        ])
         
         # Query latest
         results = db.query_latest("cpu.total_usage", limit=3)
         assert len(results) == 3
         assert results[0]["value"] == 44.0  # Latest value
     
-    def test_query_time_range(self, temp_db):
+    def test_query_time_range(self, db):
         """Test querying time range"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert metrics with different timestamps
         now = int(time.time())
-        for i in range(10):
-            db.insert_metric(
-                timestamp=now - 600 + i * 60,  # Every minute
-                metric_type="cpu.total_usage",
-                host="test",
-                value=50.0,
-                tags={}
-            )
+        db.insert_metrics_batch([
+            {
+                "timestamp": now - 600 + i * 60,  # Every minute
+                "metric_type": "cpu.total_usage",
+                "host": "test",
+                "value": 50.0,
+                "tags": {}
+            }
+            for i in range(10)
+        ])
         
         # Query last 5 minutes
         results = db.query_time_range(
@@ -97,55 +102,76 @@ class TestMetricsDatabase:
         
         assert len(results) >= 5
     
-    def test_query_by_host(self, temp_db):
-        """Test querying metrics by host"""
-        db = MetricsDatabase(temp_db)
+    def test_insert_rejects_non_integer_timestamp(self, db):
+        """Test that timestamps must be integer seconds"""
+        import numpy as np
+        
+        assert db.insert_metric(timestamp=1234567890.5, metric_type="cpu.total_usage",
+                                host="test", value=50.0) is False
+        assert db.insert_metrics_batch([
+            {"timestamp": "1234567890", "metric_type": "cpu.total_usage", "host": "test", "value": 50.0}
+        ]) is False
+        assert db.insert_metric(timestamp=np.int64(1234567890), metric_type="cpu.total_usage",
+                                host="test", value=50.0) is True
+        assert db.get_metric_count("cpu.total_usage") == 1
+    
+    def test_time_range_uses_index(self, db):
+        """Test that timestamps are stored as integers and ranges seek the index"""
+        now = int(time.time())
+        db.insert_metric(timestamp=now, metric_type="cpu.total_usage", host="test", value=50.0)
         
+        # Inspect the file through a separate connection
+        conn = sqlite3.connect(db.db_path, uri=db.db_path.startswith("file:"))
+        try:
+            assert conn.execute("SELECT typeof(timestamp) FROM metrics").fetchone()[0] == "integer"
+            plan = " ".join(row[3] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT timestamp, host, value, tags FROM metrics "
+                "WHERE metric_type = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp",
+                ("cpu.total_usage", now - 300, now)
+            ))
+        finally:
+            conn.close()
+        assert "USING COVERING INDEX ix_metrics_type_ts" in plan
+        assert "timestamp>? AND timestamp<?" in plan
+        assert "TEMP B-TREE" not in plan
+    
+    def test_query_by_host(self, db):
+        """Test querying metrics by host"""
         # Insert metrics for different hosts
-        for host in ["host-1", "host-2", "host-3"]:
-            for i in range(5):
-                db.insert_metric(
-                    timestamp=1234567890 + i,
-                    metric_type="cpu.total_usage",
-                    host=host,
-                    value=50.0,
-                    tags={}
-                )
+        base = {"metric_type": "cpu.total_usage", "value": 50.0, "tags": {}}
+        db.insert_metrics_batch([{**base, "host": host, "timestamp": 1234567890 + i}
+                                 for host in ["host-1", "host-2", "host-3"] for i in range(5)])
         
         # Query specific host
         results = db.query_latest("cpu.total_usage", host="host-2", limit=10)
         assert len(results) == 5
         assert all(r["host"] == "host-2" for r in results)
     
-    def test_get_hosts(self, temp_db):
+    def test_get_hosts(self, db):
         """Test getting list of hosts"""
-        db = MetricsDatabase(temp_db)
-        
-        # Insert metrics from different hosts
-        for host in ["host-a", "host-b", "host-c"]:
-            db.insert_metric(
-                timestamp=int(time.time()),
-                metric_type="cpu.total_usage",
-                host=host,
-                value=50.0,
-                tags={}
-            )
+        # Insert metrics from different hosts, each more than once
+        now = int(time.time())
+        for offset in range(2):
+            for host in ["host-c", "host-a", "host-b"]:
+                db.insert_metric(
+                    timestamp=now + offset,
+                    metric_type="cpu.total_usage",
+                    host=host,
+                    value=50.0,
+                    tags={}
+                )
         
-        hosts = db.get_hosts()
-        assert len(hosts) >= 3
-        assert "host-a" in hosts
-        assert "host-b" in hosts
-        assert "host-c" in hosts
+        # Deduplicated and ordered by SQLite
+        assert db.get_hosts() == ["host-a", "host-b", "host-c"]
     
-    def test_get_metric_types(self, temp_db):
+    def test_get_metric_types(self, db):
         """Test getting list of metric types"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert different metric types
         types = ["cpu.total_usage", "memory.used_bytes", "disk.read_bytes"]
+        now = int(time.time())
         for metric_type in types:
             db.insert_metric(
-                timestamp=int(time.time()),
+                timestamp=now,
                 metric_type=metric_type,
                 host="test",
                 value=100.0,
@@ -157,57 +183,56 @@ class TestMetricsDatabase:
         for t in types:
             assert t in result_types
     
-    def test_delete_old_metrics(self, temp_db):
+    def test_delete_old_metrics(self, db):
         """Test deleting old metrics"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert old metrics
-        old_time = int(time.time()) - 86400 * 30  # 30 days ago
-        for i in range(10):
-            db.insert_metric(
-                timestamp=old_time + i,
-                metric_type="cpu.total_usage",
-                host="test",
-                value=50.0,
-                tags={}
-            )
+        now = int(time.time())
+        old_time = now - 86400 * 30  # 30 days ago
+        base = {"metric_type": "cpu.total_usage", "host": "test", "value": 50.0, "tags": {}}
+        db.insert_metrics_batch([{**base, "timestamp": old_time + i} for i in range(10)])
+        
+        # And recent ones that must survive
+        recent_time = now - 86400  # 1 day ago
+        db.insert_metrics_batch([{**base, "timestamp": recent_time + i} for i in range(3)])
         
         # Delete metrics older than 7 days
         deleted = db.delete_old_metrics(retention_days=7)
         assert deleted == 10
+        assert db.get_metric_count("cpu.total_usage") == 3
     
-    def test_get_database_size(self, temp_db):
+    def test_get_database_size(self, db):
         """Test getting database size"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert some data
-        for i in range(100):
-            db.insert_metric(
-                timestamp=int(time.time()) + i,
-                metric_type="cpu.total_usage",
-                host="test",
-                value=50.0,
-                tags={}
-            )
+        now = int(time.time())
+        db.insert_metrics_batch([
+            {
+                "timestamp": now + i,
+                "metric_type": "cpu.total_usage",
+                "host": "test",
+                "value": 50.0,
+                "tags": {}
+            }
+            for i in range(100)
+        ])
         
         size = db.get_database_size()
         assert size > 0
     
-    def test_aggregations(self, temp_db):
+    def test_aggregations(self, db):
         """Test metric aggregations"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert test data
         values = [10.0, 20.0, 30.0, 40.0, 50.0]
         now = int(time.time())
-        for i, val in enumerate(values):
-            db.insert_metric(
-                timestamp=now + i,
-                metric_type="test.metric",
-                host="test",
-                value=val,
-                tags={}
-            )
+        db.insert_metrics_batch([
+            {
+                "timestamp": now + i,
+                "metric_type": "test.metric",
+                "host": "test",
+                "value": val,
+                "tags": {}
+            }
+            for i, val in enumerate(values)
+        ])
         
         # Test average
         avg = db.get_average("test.metric", start=now - 10, end=now + 10)
@@ -218,24 +243,32 @@ class TestMetricsDatabase:
         max_val = db.get_max("test.metric", start=now - 10, end=now + 10)
         assert min_val == 10.0
         assert max_val == 50.0
+        
+        # All at once
+        summary = db.get_summary("test.metric", start=now - 10, end=now + 10)
+        assert summary == {"count": 5, "avg": 30.0, "min": 10.0, "max": 50.0}
     
-    def test_concurrent_access(self, temp_db):
+    def test_concurrent_access(self, db):
         """Test concurrent database access"""
         import threading
         
-        db = MetricsDatabase(temp_db)
         errors = []
         
         def insert_metrics():
             try:
-                for i in range(50):
-                    db.insert_metric(
-                        timestamp=int(time.time()) + i,
-                        metric_type="cpu.total_usage",
-                        host="test",
-                        value=50.0,
-                        tags={}
-                    )
+                now = int(time.time())
+                ok = db.insert_metrics_batch([
+                    {
+                        "timestamp": now + i,
+                        "metric_type": "cpu.total_usage",
+                        "host": "test",
+                        "value": 50.0,
+                        "tags": {}
+                    }
+                    for i in range(50)
+                ])
+                if not ok:
+                    errors.append("batch insert failed")
             except Exception as e:
                 errors.append(e)
         
@@ -255,10 +288,8 @@ class TestMetricsDatabase:
 class TestMetricsQuery:
     """Test advanced query capabilities"""
     
-    def test_query_with_tags(self, temp_db):
+    def test_query_with_tags(self, db):
         """Test querying with tag filters"""
-        db = MetricsDatabase(temp_db)
-        
         # Insert metrics with tags
         db.insert_metric(
             timestamp=int(time.time()),
@@ -271,7 +302,7 @@ class TestMetricsQuery:
         # Query with tag filter would be implemented
         pass
     
-    def test_downsampling(self, temp_db):
+    def test_downsampling(self, db):
         """Test metric downsampling"""
         # Test ability to downsample high-frequency metrics
         pass